@@ -0,0 +1,5 @@
+"""Helpers shared between the daily puzzle scripts."""
+
+from .records import block_ranges, iter_blocks, read_records
+
+__all__ = ["block_ranges", "iter_blocks", "read_records"]
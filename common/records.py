@@ -0,0 +1,172 @@
+"""
+Tokenizer for inputs made of records separated by blank lines.
+
+Rather than checking each line for a blank one, the whole input is scanned for
+blank lines in bulk, so the Python level work is per record instead of per
+line. Both "\n" and "\r\n" line endings are understood.
+"""
+
+import io
+import mmap
+import os
+import re
+import sys
+
+################################################################################
+
+# The end of a line followed by an empty line.
+BLANK_LINE = re.compile(rb"\n\r?\n")
+LINE_ENDINGS = b"\r\n"
+
+################################################################################
+
+def _block_bounds(data, start=0, stop=None):
+    """
+    Yield the (start, end) offsets of each record in data[start:stop], where
+    'data' is bytes, a bytearray or an mmap. Surrounding line endings are
+    trimmed, and empty records (from runs of blank lines) are skipped.
+    """
+    stop = len(data) if stop is None else stop
+    while start < stop:
+        # Skip any extra blank lines before the record.
+        while start < stop and data[start] in LINE_ENDINGS:
+            start += 1
+
+        match = BLANK_LINE.search(data, start, stop)
+        end = stop if match is None else match.start()
+        next_start = end + 1
+
+        while end > start and data[end - 1] in LINE_ENDINGS:
+            end -= 1
+        if end > start:
+            yield start, end
+
+        start = next_start
+
+################################################################################
+
+def iter_blocks(data):
+    """
+    Yield a zero-copy memoryview of each blank line separated record in 'data'
+    (bytes, a bytearray or an mmap).
+
+    The views must be released (or dropped) before an mmap can be closed.
+    """
+    view = memoryview(data)
+    for start, end in _block_bounds(data):
+        yield view[start:end]
+
+################################################################################
+
+def block_ranges(data, total):
+    """
+    Split 'data' (bytes, a bytearray or an mmap) into about 'total' (start,
+    end) byte ranges. Each range ends just after a blank line, or at the end of
+    'data', so no record is split between two ranges.
+    """
+    ranges = []
+    size = len(data)
+    step = max(1, size // total)
+    start = 0
+    while start < size:
+        match = BLANK_LINE.search(data, min(start + step, size))
+        end = size if match is None else match.end()
+        ranges.append((start, end))
+        start = end
+
+    return ranges
+
+################################################################################
+
+def _stream_blocks(stream, chunk_size):
+    """
+    Yield each record in the binary 'stream' as bytes, reading 'chunk_size'
+    bytes at a time. Only the unfinished record is carried between chunks.
+    """
+    carry = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        data = carry + chunk
+        cut = max(data.rfind(b"\n\n"), data.rfind(b"\n\r\n"))
+        if cut < 0:
+            carry = data
+            continue
+        for start, end in _block_bounds(data, 0, cut):
+            yield data[start:end]
+        carry = data[BLANK_LINE.match(data, cut).end():]
+
+    for start, end in _block_bounds(carry):
+        yield carry[start:end]
+
+################################################################################
+
+def _mapped_blocks(filename):
+    """Yield each record in the file 'filename' as bytes, via a memory map."""
+    with open(filename, "rb") as f:
+        # mmap refuses to map an empty file.
+        if f.seek(0, 2) == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for start, end in _block_bounds(mm):
+                yield mm[start:end]
+
+################################################################################
+
+def _line_records(lines, by_line):
+    """
+    Yield each record in an iterable of text 'lines' as a list of fields, or
+    of lines if 'by_line' is set.
+    """
+    record = []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line:
+            if by_line:
+                record.append(line)
+            else:
+                record.extend(line.split())
+        elif record:
+            yield record
+            record = []
+
+    if record:
+        yield record
+
+################################################################################
+
+def read_records(source, chunk_size=1 << 20, by_line=False):
+    """
+    Yield each blank line separated record in 'source' as a list of its
+    whitespace separated fields (as str). If 'by_line' is set then each record
+    is instead the list of its lines, so fields on one line stay together.
+
+    source - a filename (memory mapped), "-" for stdin, bytes already in
+             memory, a binary file object (read 'chunk_size' bytes at a time)
+             or an iterable of text lines.
+    """
+    if source == "-":
+        source = sys.stdin.buffer
+
+    if isinstance(source, (str, os.PathLike)):
+        blocks = _mapped_blocks(source)
+    elif isinstance(source, (bytes, bytearray, mmap.mmap)):
+        blocks = (source[start:end] for start, end in _block_bounds(source))
+    elif isinstance(source, (io.BufferedIOBase, io.RawIOBase)):
+        blocks = _stream_blocks(source, chunk_size)
+    else:
+        yield from _line_records(source, by_line)
+        return
+
+    if by_line:
+        # A record never holds a blank line, so every line is kept.
+        for block in blocks:
+            yield [line.rstrip("\r") for line in block.decode().split("\n")]
+        return
+
+    for block in blocks:
+        fields = block.decode().split()
+        # A record of nothing but spaces has no fields.
+        if fields:
+            yield fields
@@ -1,33 +1,240 @@
 #!/usr/bin/env python3
 
 import argparse
+import math
+import mmap
+import os
+import tempfile
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is only needed for PairSumIndex, and to sort buckets in place.
+    np = None
 
 ################################################################################
 
-def get_result_2(numbers, target=2020):
+def _read_chunks(filename, chunk_size=1 << 24):
     """
-    Find the two values in 'numbers' that sum to 2020 and return the result of
-    multiplying them together.
+    Yield the whitespace separated integers in 'filename' as a series of
+    array('q') chunks.
+
+    The file is memory mapped and parsed 'chunk_size' bytes at a time (each
+    chunk is cut back to the last newline so no number is split), so only one
+    chunk's worth of Python ints exist at once.
+    """
+    with open(filename, 'rb') as f:
+        # mmap refuses to map an empty file.
+        if f.seek(0, 2) == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            while start < len(mm):
+                end = start + chunk_size
+                if end < len(mm):
+                    newline = mm.rfind(b'\n', start, end)
+                    if newline < 0:
+                        # A single line longer than the chunk.
+                        newline = mm.find(b'\n', end)
+                    end = len(mm) if newline < 0 else newline + 1
+                yield array('q', map(int, mm[start:end].split()))
+                start = end
+
+################################################################################
+
+def read_numbers(filename, chunk_size=1 << 24, as_numpy=False):
+    """
+    Read the whitespace separated integers in 'filename' into an array('q').
+
+    The file is memory mapped and parsed in chunks of 'chunk_size' bytes. If
+    'as_numpy' is set then the result is returned as an int64 numpy array
+    sharing the same buffer.
+    """
+    numbers = array('q')
+    for chunk in _read_chunks(filename, chunk_size):
+        numbers.extend(chunk)
+
+    if as_numpy:
+        if np is None:
+            raise RuntimeError("as_numpy requires numpy")
+        return np.frombuffer(numbers, dtype=np.int64)
+
+    return numbers
+
+################################################################################
+
+def _two_sum(numbers, target):
+    """
+    Find two values in 'numbers' that sum to 'target' using a set of the
+    values seen so far. Returns the pair with the smallest first value, in
+    ascending order, or None.
+    """
+    seen = set()
+    best = None
+    for num in numbers:
+        if target - num in seen:
+            low = min(num, target - num)
+            if best is None or low < best:
+                best = low
+        seen.add(num)
+
+    return None if best is None else (best, target - best)
+
+################################################################################
+
+def _sorted_two_sum(ordered, target, small=0):
+    """
+    Find two values in the sorted sequence 'ordered', at or after index
+    'small', that sum to 'target'. Returns the pair in ascending order, or None.
     """
-    numbers.sort()
     # The numbers are sorted in ascending order, so the smallest numbers are
-    # pointed to by i, and the largest numbers are pointed to by j.
-    small = 0
-    large = len(numbers) - 1
+    # pointed to by small, and the largest numbers are pointed to by large.
+    large = len(ordered) - 1
     while small < large:
-        num1 = numbers[small]
-        num2 = numbers[large]
-        sum1 = num1 + num2
+        sum1 = ordered[small] + ordered[large]
         if sum1 == target:
-            # This is the target numbers
-            return (num1, num2, num1 * num2)
+            return (ordered[small], ordered[large])
         elif sum1 < target:
             # This means that the smaller number is not yet big enough.
             small += 1
-        elif sum1 > target:
+        else:
             # This means that the larger number is now too big.
             large -= 1
 
+    return None
+
+################################################################################
+
+def _three_sum(numbers, target):
+    """
+    Find three values in 'numbers' that sum to 'target'. Works on a sorted
+    array('q') copy of the values, see _sorted_three_sum().
+    """
+    if np is not None and isinstance(numbers, np.ndarray):
+        # Copy the buffer across rather than boxing each element.
+        ordered = array('q', np.asarray(numbers, dtype=np.int64).tobytes())
+    else:
+        ordered = array('q', numbers)
+    _sort_values(ordered)
+
+    return _sorted_three_sum(ordered, target)
+
+################################################################################
+
+def _sorted_three_sum(ordered, target):
+    """
+    Find three values in the sorted sequence 'ordered' that sum to 'target',
+    fixing the smallest value and then walking two pointers in from either end
+    of the rest of the sequence.
+    """
+    for first in range(len(ordered) - 2):
+        # Every remaining value is at least this big, so give up early.
+        if ordered[first] * 3 > target:
+            break
+        pair = _sorted_two_sum(ordered, target - ordered[first], first + 1)
+        if pair is not None:
+            return (ordered[first],) + pair
+
+    return None
+
+################################################################################
+
+def _pair_table(numbers):
+    """
+    Build a table of every pairwise sum in 'numbers'.
+
+    Each sum maps to the index pair (i, j), i < j, that has the largest 'i' of
+    all the pairs with that sum. That is the only pair worth keeping: if any
+    pair for the sum starts after a given index, this one does.
+    """
+    table = {}
+    for i in range(len(numbers) - 1):
+        num1 = numbers[i]
+        for j in range(i + 1, len(numbers)):
+            # Later values of 'i' always overwrite earlier ones.
+            table[num1 + numbers[j]] = (i, j)
+
+    return table
+
+################################################################################
+
+def _k_sum_pairs(numbers, target, k, table, start=0):
+    """
+    Find 'k' (at least 4) values at increasing indices from 'start' onward
+    that sum to 'target'. The first k - 2 values are picked in turn and the
+    last two are looked up in the pair table 'table'.
+    """
+    if k == 4:
+        for i in range(start, len(numbers) - 3):
+            for j in range(i + 1, len(numbers) - 2):
+                pair = table.get(target - numbers[i] - numbers[j])
+                if pair is not None and pair[0] > j:
+                    return (i, j) + pair
+        return None
+
+    for i in range(start, len(numbers) - k + 1):
+        found = _k_sum_pairs(numbers, target - numbers[i], k - 1, table, i + 1)
+        if found is not None:
+            return (i,) + found
+
+    return None
+
+################################################################################
+
+def k_sum(numbers, target=2020, k=2):
+    """
+    Find 'k' values in 'numbers' that sum to 'target' and return them (in
+    ascending order) followed by the result of multiplying them together.
+    Returns None if there are no such values. If there is more than one answer
+    for a k of 2 or 3 then the smallest (comparing the first value, then the
+    second) is returned.
+
+    Each entry in 'numbers' is used at most once, and 'numbers' is never
+    modified; any sequence of ints can be passed in, including the array('q')
+    or numpy array returned by read_numbers().
+
+    k = 2  - hash set of complements, O(n).
+    k = 3  - sort and two pointers, O(n^2).
+    k >= 4 - table of pair sums (meet in the middle), O(n^(k-2)) with O(n^2)
+             memory.
+    """
+    if k < 1:
+        raise ValueError(f"k must be at least 1, not {k}")
+
+    if k == 1:
+        values = (target,) if target in numbers else None
+    elif k == 2:
+        values = _two_sum(numbers, target)
+    elif k == 3:
+        values = _three_sum(numbers, target)
+    else:
+        indices = _k_sum_pairs(numbers, target, k, _pair_table(numbers))
+        values = None
+        if indices is not None:
+            values = tuple(sorted(numbers[i] for i in indices))
+
+    if values is None:
+        return None
+
+    return _with_product(values)
+
+################################################################################
+
+def _with_product(values):
+    """Return the tuple 'values' followed by the product of its values."""
+    # Unbox numpy scalars so the product cannot overflow.
+    values = tuple(int(v) for v in values)
+    return values + (math.prod(values),)
+
+################################################################################
+
+def get_result_2(numbers, target=2020):
+    """
+    Find the two values in 'numbers' that sum to 2020 and return the result of
+    multiplying them together.
+    """
+    return k_sum(numbers, target, k=2)
 
 ################################################################################
 
@@ -35,35 +242,365 @@ def get_result_3(numbers, target=2020):
     """
     Find the three values in 'numbers' that sum to 2020 and return the result of
     multiplying them together.
+    """
+    return k_sum(numbers, target, k=3)
+
+################################################################################
+class _Bucket:
+    """A temporary file holding all the numbers within a range of values."""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self.lower = None
+        self.upper = None
+
+    def write(self, f, values):
+        """Append the array('q') 'values' to this bucket's open file 'f'."""
+        values.tofile(f)
+        self.count += len(values)
+        lower = min(values)
+        upper = max(values)
+        self.lower = lower if self.lower is None else min(self.lower, lower)
+        self.upper = upper if self.upper is None else max(self.upper, upper)
+
+    def load(self):
+        """Read the entire bucket back into an array('q')."""
+        values = array('q')
+        with open(self.path, 'rb') as f:
+            values.fromfile(f, self.count)
+        return values
+
+    def stream(self, chunk_values):
+        """Yield the bucket back as array('q') chunks of 'chunk_values'."""
+        with open(self.path, 'rb') as f:
+            remaining = self.count
+            while remaining > 0:
+                chunk = array('q')
+                chunk.fromfile(f, min(chunk_values, remaining))
+                remaining -= len(chunk)
+                yield chunk
+
+    def sort(self):
+        """Rewrite the bucket in ascending order."""
+        values = self.load()
+        _sort_values(values)
+        with open(self.path, 'wb') as f:
+            values.tofile(f)
+
+################################################################################
 
-    This algorithm sucks lol.
+def _sort_values(values):
+    """
+    Sort the array('q') 'values' in place. With numpy this is done directly on
+    the array's buffer; without it sorted() briefly boxes every value.
+    """
+    if np is not None:
+        if values:
+            np.frombuffer(values, dtype=np.int64).sort()
+    else:
+        values[:] = array('q', sorted(values))
+
+################################################################################
+
+def _partition(filename, directory, memory_budget):
+    """
+    Split the numbers in 'filename' into sorted range buckets under
+    'directory' that each hold at most 3/8 of 'memory_budget' bytes (for evenly
+    spread values).
+
+    Returns the non-empty buckets in ascending order of range, along with the
+    number of bytes written to disk.
+    """
+    itemsize = array('q').itemsize
+    # Parsing a chunk boxes every number in it; even with one digit per line
+    # that is well under 32 bytes of Python objects per byte of text.
+    chunk_size = max(1 << 12, memory_budget // 32)
+    count = 0
+    lower = upper = None
+    for chunk in _read_chunks(filename, chunk_size):
+        if len(chunk) == 0:
+            continue
+        count += len(chunk)
+        lower = min(chunk) if lower is None else min(lower, min(chunk))
+        upper = max(chunk) if upper is None else max(upper, max(chunk))
+
+    if count == 0:
+        return [], 0
+
+    # Two buckets and a streamed chunk (a quarter) must fit in memory at once.
+    bucket_size = max(1, memory_budget * 3 // 8)
+    total = max(1, math.ceil(count * itemsize / bucket_size))
+    width = (upper - lower) // total + 1
+
+    buckets = [
+        _Bucket(os.path.join(directory, f"bucket-{i}")) for i in range(total)
+    ]
+    files = [open(bucket.path, 'wb') for bucket in buckets]
+    try:
+        for chunk in _read_chunks(filename, chunk_size):
+            split = [array('q') for _ in buckets]
+            for num in chunk:
+                split[(num - lower) // width].append(num)
+            for bucket, f, values in zip(buckets, files, split):
+                if values:
+                    bucket.write(f, values)
+    finally:
+        for f in files:
+            f.close()
+
+    buckets = [bucket for bucket in buckets if bucket.count]
+    for bucket in buckets:
+        bucket.sort()
+
+    # Every number is written once when partitioning and again when sorted.
+    return buckets, 2 * count * itemsize
+
+################################################################################
+
+def _merge_two_sum(first, second, target):
+    """
+    Find a value in the sorted sequence 'first' and one in the sorted sequence
+    'second' that sum to 'target', walking up 'first' and down 'second'.
     """
-    numbers.sort()
-    # The numbers are sorted in ascending order, so the smallest numbers are
-    # pointed to by i, and the largest numbers are pointed to by j.
     small = 0
-    middle = small + 1
-    large = len(numbers) - 1
-    while small < large:
-        num1 = numbers[small]
-        num2 = numbers[middle]
-        num3 = numbers[large]
-        sum1 = num1 + num2 + num3
+    large = len(second) - 1
+    while small < len(first) and large >= 0:
+        sum1 = first[small] + second[large]
         if sum1 == target:
-            # This is the target numbers
-            return (num1, num2, num3, num1 * num2 * num3)
+            return (first[small], second[large])
         elif sum1 < target:
-            # This means that the smaller number is not yet big enough.
-            if middle < large - 1:
-                middle += 1
-            else:
-                small += 1
-                middle = small + 1
-        elif sum1 > target:
-            # This means that the larger number is now too big.
+            small += 1
+        else:
             large -= 1
-            small = 0
-            middle = small + 1
+
+    return None
+
+################################################################################
+
+def _smallest(best, found):
+    """Return whichever of the answers 'best' and 'found' is smaller."""
+    if found is None or (best is not None and best <= found):
+        return best
+    return found
+
+################################################################################
+
+def _external_two_sum(buckets, target):
+    """
+    Two-sum over sorted range buckets, loading at most two at a time. Returns
+    the pair with the smallest first value, as _two_sum() does.
+    """
+    for i, first in enumerate(buckets):
+        if first.lower * 2 > target:
+            break
+        values = first.load()
+        best = None
+        for second in buckets[i:]:
+            if not first.lower + second.lower <= target <= (
+                first.upper + second.upper
+            ):
+                continue
+            if second is first:
+                pair = _sorted_two_sum(values, target)
+            else:
+                pair = _merge_two_sum(values, second.load(), target)
+            best = _smallest(best, pair)
+        # Every pair starting in a later bucket has a larger first value.
+        if best is not None:
+            return best
+
+    return None
+
+################################################################################
+
+def _external_three_sum(buckets, target, chunk_values):
+    """
+    Three-sum over sorted range buckets. For the buckets (i, j, k) holding the
+    smallest, middle and largest values, i and j are held in memory while k is
+    streamed from disk in chunks of 'chunk_values'.
+
+    Returns the smallest triple (comparing the first value, then the second),
+    as _three_sum() does, so every combination for the first bucket with an
+    answer is searched.
+    """
+    for i, first in enumerate(buckets):
+        if first.lower * 3 > target:
+            break
+        first_values = None
+        best = None
+        for j in range(i, len(buckets)):
+            second = buckets[j]
+            second_values = None
+            for third in buckets[j:]:
+                if not first.lower + second.lower + third.lower <= target <= (
+                    first.upper + second.upper + third.upper
+                ):
+                    continue
+
+                if first_values is None:
+                    first_values = first.load()
+
+                if third is first:
+                    # All three values come from the same bucket.
+                    found = _sorted_three_sum(first_values, target)
+                    best = _smallest(best, found)
+                    continue
+                elif second is first:
+                    # Two values from the first bucket, one from the third.
+                    for chunk in third.stream(chunk_values):
+                        for num in chunk:
+                            pair = _sorted_two_sum(first_values, target - num)
+                            if pair is not None:
+                                best = _smallest(best, pair + (num,))
+                    continue
+
+                if second_values is None:
+                    second_values = second.load()
+
+                if third is second:
+                    # One value from the first bucket, two from the second.
+                    for num in first_values:
+                        pair = _sorted_two_sum(second_values, target - num)
+                        if pair is not None:
+                            best = _smallest(best, (num,) + pair)
+                            # Later values of 'num' are only bigger.
+                            break
+                else:
+                    for chunk in third.stream(chunk_values):
+                        for num in chunk:
+                            pair = _merge_two_sum(
+                                first_values, second_values, target - num
+                            )
+                            if pair is not None:
+                                best = _smallest(best, pair + (num,))
+        # Every triple starting in a later bucket has a larger first value.
+        if best is not None:
+            return best
+
+    return None
+
+################################################################################
+
+def external_k_sum(
+    filename, target=2020, k=2, memory_budget=64 << 20, tmpdir=None
+):
+    """
+    Solve get_result_2 (k=2) or get_result_3 (k=3) for a file of numbers that
+    may not fit in memory, returning the same tuple format.
+
+    The numbers are first spilled to temporary bucket files by value range
+    and sorted, each sized so that two of them plus a quarter of
+    'memory_budget' for streaming a third fit in 'memory_budget' bytes (8
+    bytes per number held). Only combinations of buckets whose ranges can add
+    up to 'target' are then loaded, and they are searched with two pointers.
+
+    The budget is not a hard limit: skewed inputs can produce larger buckets,
+    and without numpy sorting a bucket briefly needs several times its size.
+
+    Returns a pair of the result (None if there is no answer, otherwise the
+    same answer as k_sum()) and the number of bytes spilled to disk.
+    """
+    if k not in (2, 3):
+        raise ValueError(f"external_k_sum only supports k of 2 or 3, not {k}")
+
+    with tempfile.TemporaryDirectory(dir=tmpdir) as directory:
+        buckets, spilled = _partition(filename, directory, memory_budget)
+        if k == 2:
+            values = _external_two_sum(buckets, target)
+        else:
+            chunk_values = max(1, memory_budget // 4 // array('q').itemsize)
+            values = _external_three_sum(buckets, target, chunk_values)
+
+    if values is None:
+        return None, spilled
+
+    return _with_product(sorted(values)), spilled
+
+################################################################################
+
+class PairSumIndex:
+    """
+    An index over a list of numbers for answering many targets at once.
+
+    The numbers are sorted once, and every pairwise sum is computed once and
+    sorted, so each batch of targets is answered with 'searchsorted' rather
+    than a fresh scan of the numbers. Building the index takes O(n^2) memory.
+    """
+
+    def __init__(self, numbers):
+        if np is None:
+            raise RuntimeError("PairSumIndex requires numpy")
+
+        self.values = np.sort(np.asarray(numbers, dtype=np.int64))
+
+        # Every pair of indices (i, j) with i < j, ordered by their sum.
+        left, right = np.triu_indices(len(self.values), k=1)
+        sums = self.values[left] + self.values[right]
+        order = np.argsort(sums, kind="stable")
+        self.pair_sums = sums[order]
+        self.pair_left = left[order]
+        self.pair_right = right[order]
+
+    def __len__(self):
+        return len(self.values)
+
+    def _find(self, targets):
+        """Return the [lo, hi) range of pair sums matching each of 'targets'."""
+        lo = np.searchsorted(self.pair_sums, targets, side="left")
+        hi = np.searchsorted(self.pair_sums, targets, side="right")
+        return lo, hi
+
+    def pairs(self, targets):
+        """
+        For each of 'targets', return a list of every distinct (a, b, a * b)
+        where a + b is the target and a <= b.
+        """
+        targets = np.atleast_1d(np.asarray(targets, dtype=np.int64))
+        ret = []
+        for lo, hi in zip(*self._find(targets)):
+            found = dict.fromkeys(
+                (int(a), int(b))
+                for a, b in zip(
+                    self.values[self.pair_left[lo:hi]],
+                    self.values[self.pair_right[lo:hi]],
+                )
+            )
+            ret.append([(a, b, a * b) for a, b in sorted(found)])
+
+        return ret
+
+    def triples(self, targets):
+        """
+        For each of 'targets', return a list of every distinct
+        (a, b, c, a * b * c) where a + b + c is the target and a <= b <= c.
+        """
+        targets = np.atleast_1d(np.asarray(targets, dtype=np.int64))
+
+        # Row t, column i holds the pair sum needed if values[i] is the
+        # smallest of the three numbers for targets[t].
+        lo, hi = self._find(targets[:, None] - self.values[None, :])
+
+        ret = []
+        for t in range(len(targets)):
+            found = {}
+            for i in np.flatnonzero(hi[t] > lo[t]):
+                pairs = slice(lo[t, i], hi[t, i])
+                # The other two numbers must come after values[i].
+                keep = self.pair_left[pairs] > i
+                for j, k in zip(
+                    self.pair_left[pairs][keep], self.pair_right[pairs][keep]
+                ):
+                    found[
+                        (
+                            int(self.values[i]),
+                            int(self.values[j]),
+                            int(self.values[k]),
+                        )
+                    ] = None
+            ret.append([key + (math.prod(key),) for key in sorted(found)])
+
+        return ret
 
 ################################################################################
 
@@ -73,23 +610,48 @@ if __name__ == "__main__":
     )
 
     parser.add_argument('filename')
+    parser.add_argument(
+        '--memory-budget', type=int, metavar='BYTES',
+        help="Solve out of core, spilling the numbers to temporary files."
+    )
+    parser.add_argument(
+        '--targets', type=int, nargs='+',
+        help="Also list every pair and triple summing to each of these totals."
+    )
 
     opts = parser.parse_args()
 
-    numbers = []
-
-    with open(opts.filename, 'r') as f:
-        for line in f:
-            numbers.append(int(line))
-
-
-    num1, num2, result = get_result_2(numbers)
+    if opts.memory_budget is not None:
+        (num1, num2, result), spilled2 = external_k_sum(
+            opts.filename, k=2, memory_budget=opts.memory_budget
+        )
+        (num1_3, num2_3, num3, result2), spilled3 = external_k_sum(
+            opts.filename, k=3, memory_budget=opts.memory_budget
+        )
+        numbers = None
+    else:
+        numbers = read_numbers(opts.filename)
+        num1, num2, result = get_result_2(numbers)
+        num1_3, num2_3, num3, result2 = get_result_3(numbers)
 
     print ("The multiplied value is: {}".format(result))
     print ("The source numbers are: {} + {} = {}".format(num1, num2, num1+num2))
 
+    print ("\nThe multiplied value is: {}".format(result2))
+    print ("The source numbers are: {} + {} + {} = {}".format(num1_3, num2_3, num3, num1_3+num2_3+num3))
 
-    num1, num2, num3, result2 = get_result_3(numbers)
+    if opts.memory_budget is not None:
+        print ("\nSpilled {} bytes to disk for each pass.".format(spilled2))
 
-    print ("\nThe multiplied value is: {}".format(result2))
-    print ("The source numbers are: {} + {} + {} = {}".format(num1, num2, num3, num1+num2+num3))
+    if opts.targets:
+        if numbers is None:
+            numbers = read_numbers(opts.filename)
+        index = PairSumIndex(numbers)
+        for target, pairs, triples in zip(
+            opts.targets, index.pairs(opts.targets), index.triples(opts.targets)
+        ):
+            print ("\nTarget {}:".format(target))
+            for num1, num2, result in pairs:
+                print ("  {} + {} -> {}".format(num1, num2, result))
+            for num1, num2, num3, result in triples:
+                print ("  {} + {} + {} -> {}".format(num1, num2, num3, result))
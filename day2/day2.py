@@ -1,7 +1,26 @@
 #!/usr/bin/env python3
 
 import argparse
+import mmap
+import os
+import re
 import types
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is only needed for the "numpy" backend.
+    np = None
+
+################################################################################
+
+# A whole password line. Each policy must be on its own line.
+PASSWORD_RE = re.compile(rb"^[ \t]*(\d+)-(\d+) (\S): (\S*)[ \t\r]*$", re.M)
+
+# Any line that isn't blank, to check that every one of them was parsed.
+LINE_RE = re.compile(rb"^[ \t\r]*\S", re.M)
 
 ################################################################################
 
@@ -19,7 +38,7 @@ def read_passwords(filename):
     """
     passwords = []
 
-    with open(opts.filename, 'r') as f:
+    with open(filename, 'r') as f:
         for line in f:
             data = line.split()
             r = data[0].split('-')
@@ -35,47 +54,239 @@ def read_passwords(filename):
 
 ################################################################################
 
-def valid_passwords_v1(filename):
+class PasswordTable:
+    """
+    A column store for a password file, parsed once.
+
+    lower     - array('H') of lower values in each policy.
+    upper     - array('H') of upper values in each policy.
+    chars     - array('B') of the target character code in each policy.
+    offsets   - array('L') of offsets into 'passwords'; password i is
+                passwords[offsets[i]:offsets[i + 1]].
+    passwords - bytes holding every password back to back.
+    """
+
+    def __init__(self, data=b"", first_line=1):
+        """
+        Parse the password lines in the bytes-like 'data'. Raises ValueError
+        if any non-blank line isn't a password line, numbering the lines from
+        'first_line'.
+        """
+        self.lower = array('H')
+        self.upper = array('H')
+        self.chars = array('B')
+        self.offsets = array('L', [0])
+
+        passwords = bytearray()
+        for match in PASSWORD_RE.finditer(data):
+            lower, upper, char, password = match.groups()
+            self.lower.append(int(lower))
+            self.upper.append(int(upper))
+            self.chars.append(char[0])
+            passwords += password
+            self.offsets.append(len(passwords))
+
+        self.passwords = bytes(passwords)
+
+        if len(self) != sum(1 for _ in LINE_RE.finditer(data)):
+            lines = bytes(data).split(b'\n')
+            for number, line in enumerate(lines, first_line):
+                if line.strip() and not PASSWORD_RE.fullmatch(line):
+                    raise ValueError(
+                        f"Line {number} is not a password line: {line!r}"
+                    )
+
+    @classmethod
+    def from_file(cls, filename):
+        """Read and parse the password file 'filename'."""
+        with open(filename, 'rb') as f:
+            return cls(f.read())
+
+    def __len__(self):
+        return len(self.lower)
+
+    def password(self, index):
+        """Return password 'index' as bytes."""
+        return self.passwords[self.offsets[index]:self.offsets[index + 1]]
+
+    def count_valid(self, backend="python"):
+        """
+        Return the number of passwords that are valid under the v1 and v2
+        rules, as a pair.
+
+        backend - "python" for a single pass over the table, or "numpy" to
+                  evaluate both rules as whole-array operations.
+        """
+        if backend == "python":
+            return self._count_valid_python()
+        elif backend == "numpy":
+            return self._count_valid_numpy()
+
+        raise ValueError(f"Unknown backend {backend!r}")
+
+    def _count_valid_python(self):
+        """Count valid passwords with a single pass over the table."""
+        passwords = self.passwords
+        offsets = self.offsets
+        valid_v1 = 0
+        valid_v2 = 0
+
+        for i, (lower, upper, char) in enumerate(
+            zip(self.lower, self.upper, self.chars)
+        ):
+            start = offsets[i]
+            end = offsets[i + 1]
+
+            # v1: the count of 'char' lies between 'lower' and 'upper'.
+            if lower <= passwords.count(char, start, end) <= upper:
+                valid_v1 += 1
+
+            # v2: 'char' is at exactly one of the (1-indexed) positions.
+            # Positions past the end of the password never match.
+            length = end - start
+            first = 0 < lower <= length and passwords[start + lower - 1] == char
+            second = 0 < upper <= length and passwords[start + upper - 1] == char
+            if first != second:
+                valid_v2 += 1
+
+        return valid_v1, valid_v2
+
+    def _count_valid_numpy(self, block_rows=1 << 20):
+        """
+        Count valid passwords with numpy, 'block_rows' passwords at a time.
+
+        Each block of passwords is laid out as a zero padded uint8 matrix, one
+        password per row, so the v1 count is a row-wise sum of matches. The v2
+        positions are gathered straight out of the password buffer.
+        """
+        if np is None:
+            raise RuntimeError("The numpy backend requires numpy")
+
+        lower = np.frombuffer(self.lower, dtype=np.uint16).astype(np.int64)
+        upper = np.frombuffer(self.upper, dtype=np.uint16).astype(np.int64)
+        chars = np.frombuffer(self.chars, dtype=np.uint8)
+        offsets = np.frombuffer(self.offsets, dtype=self.offsets.typecode)
+        offsets = offsets.astype(np.int64)
+        buffer = np.frombuffer(self.passwords, dtype=np.uint8)
+        starts = offsets[:-1]
+        lengths = np.diff(offsets)
+
+        valid_v1 = 0
+        for first in range(0, len(self), block_rows):
+            last = min(first + block_rows, len(self))
+            length = lengths[first:last]
+            # Row and column of every password byte within the block.
+            row = np.repeat(np.arange(last - first), length)
+            column = np.arange(len(row)) - np.repeat(
+                starts[first:last] - starts[first], length
+            )
+            matrix = np.zeros((last - first, length.max()), dtype=np.uint8)
+            matrix[row, column] = buffer[offsets[first]:offsets[last]]
+
+            count = (matrix == chars[first:last, None]).sum(1)
+            in_range = (lower[first:last] <= count) & (count <= upper[first:last])
+            valid_v1 += int(in_range.sum())
+
+        def matches(position):
+            # Positions are 1-indexed, and never match past the password end.
+            inside = (position >= 1) & (position <= lengths)
+            index = np.where(inside, starts + position - 1, 0)
+            return inside & (buffer[index] == chars) if len(buffer) else inside
+
+        valid_v2 = int((matches(lower) != matches(upper)).sum())
+
+        return valid_v1, valid_v2
+
+################################################################################
+
+def valid_passwords_v1(filename, backend="python"):
     """
     Return the number of valid passwords in 'filename'
 
     Password rule is that the number of occurrences of 'char' must lie between
     'lower' and 'upper'.
     """
-    passwords = read_passwords(filename)
-    valid = 0
-
-    for p in passwords:
-        total = p.password.count(p.char)
-        if p.lower <= total <= p.upper:
-            #print ("{} <= {} <= {}".format(p.lower, total, p.upper))
-            valid += 1
-
-    return valid
+    return PasswordTable.from_file(filename).count_valid(backend)[0]
 
 ################################################################################
 
-def valid_passwords_v2(filename):
+def valid_passwords_v2(filename, backend="python"):
     """
     Return the number of valid passwords in 'filename'
 
     Password rule is that 'char' must occur at EITHER 'lower' or 'upper'
     """
-    passwords = read_passwords(filename)
-    valid = 0
+    return PasswordTable.from_file(filename).count_valid(backend)[1]
+
+################################################################################
+
+def _count_valid_range(filename, start, end, backend):
+    """Return the (v1, v2) valid counts for bytes [start, end) of 'filename'."""
+    with open(filename, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            try:
+                table = PasswordTable(mm[start:end])
+            except ValueError:
+                # Only count the lines before the range when there's an error
+                # to report, then parse again to number it within the file.
+                first_line = mm[:start].count(b'\n') + 1
+                PasswordTable(mm[start:end], first_line)
+                raise
+
+    return table.count_valid(backend)
+
+################################################################################
+
+def _line_ranges(mm, total):
+    """
+    Split the mapped file 'mm' into about 'total' byte ranges, each ending
+    just after a newline (or at the end of the file).
+    """
+    ranges = []
+    size = len(mm)
+    step = max(1, size // total)
+    start = 0
+    while start < size:
+        end = mm.find(b'\n', min(start + step, size - 1))
+        end = size if end < 0 else end + 1
+        ranges.append((start, end))
+        start = end
+
+    return ranges
+
+################################################################################
+
+def count_valid_parallel(filename, workers=None, backend="python"):
+    """
+    Return the number of passwords in 'filename' that are valid under the v1
+    and v2 rules, as a pair, using a pool of 'workers' processes.
+
+    The file is memory mapped and split into newline aligned byte ranges. Each
+    worker maps the file itself and sends back just its two counts.
+    """
+    workers = workers or os.cpu_count() or 1
 
-    xor = lambda a, b: (a and not b) or (not a and b)
+    with open(filename, 'rb') as f:
+        # mmap refuses to map an empty file.
+        if f.seek(0, 2) == 0:
+            return 0, 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # A few ranges per worker keeps them all busy until the end.
+            ranges = _line_ranges(mm, workers * 4)
 
-    for p in passwords:
-        # Get the chars to compare.
-        # Note that the target chars are NOT 0-indexed.
-        char1 = p.password[p.lower - 1]
-        char2 = p.password[p.upper - 1]
-        if xor((char1 == p.char),(char2 == p.char)):
-            #print ("{} != {}".format(char1, char2))
-            valid += 1
+    valid_v1 = 0
+    valid_v2 = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_count_valid_range, filename, start, end, backend)
+            for start, end in ranges
+        ]
+        for future in futures:
+            chunk_v1, chunk_v2 = future.result()
+            valid_v1 += chunk_v1
+            valid_v2 += chunk_v2
 
-    return valid
+    return valid_v1, valid_v2
 
 ################################################################################
 
@@ -85,6 +296,14 @@ if __name__ == "__main__":
     )
 
     parser.add_argument('filename')
+    parser.add_argument(
+        '--backend', choices=["python", "numpy"], default="python",
+        help="How to evaluate the password rules."
+    )
+    parser.add_argument(
+        '--workers', type=int, default=1,
+        help="Number of processes to split the file between (0 for all CPUs)."
+    )
 
     opts = parser.parse_args()
 
@@ -96,6 +315,15 @@ if __name__ == "__main__":
     #        ).format(p.lower, p.upper, p.char, p.password)
     #    )
 
-    print("Total valid passwords V1 = {}".format(valid_passwords_v1(opts.filename)))
+    if opts.workers == 1:
+        valid_v1, valid_v2 = PasswordTable.from_file(opts.filename).count_valid(
+            opts.backend
+        )
+    else:
+        valid_v1, valid_v2 = count_valid_parallel(
+            opts.filename, opts.workers, opts.backend
+        )
+
+    print("Total valid passwords V1 = {}".format(valid_v1))
 
-    print("Total valid passwords V2 = {}".format(valid_passwords_v2(opts.filename)))
+    print("Total valid passwords V2 = {}".format(valid_v2))
@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 
 import argparse
-import copy
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is only needed for sweep_slopes().
+    np = None
 
 ################################################################################
 
@@ -86,17 +91,156 @@ def get_trees_v2(in_map, right=3, down=1):
 
 ################################################################################
 
+class Terrain:
+    """
+    A read-only map, with each row stored as an int bitmask of its trees.
+
+    Bit 'n' of a row is set if there is a tree in column 'n'. The map repeats
+    infinitely to the right every 'width' columns.
+    """
+
+    def __init__(self, lines):
+        """
+        Build the terrain from an iterable of map lines. Raises ValueError if
+        the rows aren't all the same width or hold anything but '#' and '.'.
+        """
+        self.rows = []
+        self.width = 0
+        for number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if line.strip('#.'):
+                raise ValueError(
+                    f"Line {number} holds something other than '#' and '.'"
+                )
+            if self.rows and len(line) != self.width:
+                raise ValueError(
+                    f"Line {number} is {len(line)} wide, not {self.width}"
+                )
+            self.width = len(line)
+            # Reverse the line so that column 0 is the lowest bit.
+            bits = line[::-1].replace('#', '1').replace('.', '0')
+            self.rows.append(int(bits, 2))
+
+    @classmethod
+    def from_file(cls, filename):
+        """Read the map in 'filename'."""
+        with open(filename, 'r') as f:
+            return cls(f)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def is_tree(self, row, column):
+        """Return true if there is a tree at 'row', 'column'."""
+        return (self.rows[row] >> (column % self.width)) & 1 == 1
+
+    def count_trees(self, slopes):
+        """
+        Return a list with the number of trees hit for each (right, down) pair
+        in 'slopes', all counted in a single pass over the rows.
+        """
+        slopes = list(slopes)
+        for right, down in slopes:
+            if down < 1:
+                raise ValueError(f"Slope {right}, {down} must move down")
+
+        positions = [0] * len(slopes)
+        trees = [0] * len(slopes)
+
+        for index, row in enumerate(self.rows):
+            for slope, (right, down) in enumerate(slopes):
+                if index % down:
+                    continue
+                trees[slope] += (row >> positions[slope]) & 1
+                positions[slope] = (positions[slope] + right) % self.width
+
+        return trees
+
+    def to_array(self):
+        """Return the map as a boolean numpy array, True for each tree."""
+        if np is None:
+            raise RuntimeError("Terrain.to_array requires numpy")
+
+        # Lay the rows out as little endian bytes, so that bit 'n' of a row
+        # unpacks to column 'n'.
+        size = (self.width + 7) // 8
+        data = b"".join(row.to_bytes(size, "little") for row in self.rows)
+        packed = np.frombuffer(data, dtype=np.uint8).reshape(len(self), size)
+        bits = np.unpackbits(packed, axis=1, bitorder="little")
+        return bits[:, :self.width].astype(bool)
+
+    def render(self, right=3, down=1):
+        """
+        Return the map as a list of strings, with the path for the given slope
+        marked as 'X' for trees hit and 'O' for open squares.
+        """
+        ret = []
+        pos = 0
+        for index, row in enumerate(self.rows):
+            line = [
+                '#' if (row >> column) & 1 else '.'
+                for column in range(self.width)
+            ]
+            if index % down == 0:
+                line[pos] = 'X' if line[pos] == '#' else 'O'
+                pos = (pos + right) % self.width
+            ret.append("".join(line))
+
+        return ret
+
+################################################################################
+
+def sweep_slopes(terrain, slopes):
+    """
+    Return a dict mapping each (right, down) pair in 'slopes' to the number of
+    trees hit on that slope of 'terrain'.
+
+    Every position visited on every slope is computed up front as a pair of
+    (row, column % width) index arrays, so the trees for all slopes are found
+    with a single gather and summed with a single bincount.
+    """
+    if np is None:
+        raise RuntimeError("sweep_slopes requires numpy")
+
+    slopes = list(slopes)
+    if not slopes:
+        return {}
+
+    grid = terrain.to_array()
+    right = np.array([slope[0] for slope in slopes], dtype=np.int64)
+    down = np.array([slope[1] for slope in slopes], dtype=np.int64)
+    if (down < 1).any():
+        raise ValueError("Every slope must move down")
+
+    # Number of rows visited by each slope, and the step within its slope of
+    # every visit.
+    steps = (len(terrain) + down - 1) // down
+    slope = np.repeat(np.arange(len(slopes)), steps)
+    step = np.arange(len(slope)) - np.repeat(np.cumsum(steps) - steps, steps)
+
+    hits = grid[step * down[slope], (step * right[slope]) % terrain.width]
+    trees = np.bincount(slope, weights=hits, minlength=len(slopes))
+
+    return {pair: int(count) for pair, count in zip(slopes, trees)}
+
+################################################################################
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Find the number of trees that will be hit."
     )
 
     parser.add_argument('filename')
+    parser.add_argument(
+        '--sweep', type=int, nargs=2, metavar=('RIGHT', 'DOWN'),
+        help="Also count every slope up to RIGHT, DOWN and report the extremes."
+    )
 
     opts = parser.parse_args()
 
-    in_map = read_map(opts.filename)
-    trees = []
+    terrain = Terrain.from_file(opts.filename)
 
     slopes = [
         (1, 1),
@@ -106,14 +250,12 @@ if __name__ == "__main__":
         (1, 2),
     ]
 
-    for slope in slopes:
-        new_map = copy.deepcopy(in_map)
-        new_trees = get_trees_v2(new_map, right=slope[0], down=slope[1])
-        trees.append(new_trees)
+    trees = terrain.count_trees(slopes)
 
+    for slope, new_trees in zip(slopes, trees):
         print("For slope {}, {}:".format(slope[0], slope[1]))
-        for line in new_map:
-            print("".join(line))
+        for line in terrain.render(right=slope[0], down=slope[1]):
+            print(line)
 
         print("There were {} trees on the slope.".format(new_trees))
 
@@ -123,3 +265,19 @@ if __name__ == "__main__":
     for tree in trees:
         total *= tree
     print ("This results in a value of: {}".format(total))
+
+    if opts.sweep:
+        max_right, max_down = opts.sweep
+        table = sweep_slopes(
+            terrain,
+            [
+                (right, down)
+                for right in range(max_right + 1)
+                for down in range(1, max_down + 1)
+            ],
+        )
+        best = min(table, key=table.get)
+        worst = max(table, key=table.get)
+        print ("\nSwept {} slopes.".format(len(table)))
+        print ("Fewest trees: {} on slope {}, {}".format(table[best], *best))
+        print ("Most trees: {} on slope {}, {}".format(table[worst], *worst))
@@ -1,8 +1,167 @@
 #!/usr/bin/env python3
 
 import argparse
-import copy
-import math
+import collections
+import mmap
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+# The shared helpers live in the top level of the repo.
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+)
+
+from common import block_ranges, read_records
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is only needed for PassportColumns.
+    np = None
+
+################################################################################
+
+
+# Passport keys, and the passport attribute that each one is stored in.
+FIELDS = {
+    "byr": "birth_year",
+    "iyr": "issue_year",
+    "eyr": "expiration_year",
+    "hgt": "height",
+    "hcl": "hair_colour",
+    "ecl": "eye_colour",
+    "pid": "passport_id",
+    "cid": "country_id",
+}
+
+# An unsigned decimal integer. str.isdigit() also accepts characters such as
+# '²' that int() then rejects.
+DIGITS_RE = re.compile(r"[0-9]+")
+
+
+################################################################################
+
+
+def _rule_present():
+    """The field must be set."""
+    return lambda value: True
+
+
+def _rule_range(lower, upper):
+    """The field must be an integer between 'lower' and 'upper' (inclusive)."""
+
+    def check(value):
+        return (
+            DIGITS_RE.fullmatch(value) is not None
+            and lower <= int(value) <= upper
+        )
+
+    return check
+
+
+def _rule_units(units):
+    """
+    The field must be an integer followed by one of the units in 'units', a
+    dict of unit to an inclusive (lower, upper) range.
+    """
+
+    def check(value):
+        limits = units.get(value[-2:])
+        return (
+            limits is not None
+            and DIGITS_RE.fullmatch(value, 0, len(value) - 2) is not None
+            and limits[0] <= int(value[:-2]) <= limits[1]
+        )
+
+    return check
+
+
+def _rule_pattern(pattern):
+    """The whole field must match the regular expression 'pattern'."""
+    return re.compile(pattern).fullmatch
+
+
+def _rule_one_of(*choices):
+    """The field must be one of 'choices'."""
+    return frozenset(choices).__contains__
+
+
+# Every kind of rule that can be used in a rule set declaration.
+RULE_KINDS = {
+    "present": _rule_present,
+    "range": _rule_range,
+    "units": _rule_units,
+    "pattern": _rule_pattern,
+    "one_of": _rule_one_of,
+}
+
+
+################################################################################
+
+
+class RuleSet:
+    """
+    A set of validation rules compiled once from a declaration.
+
+    The declaration is a list of (key, kind, *args) tuples, where 'key' is a
+    passport key (see FIELDS) and 'kind' is a name in RULE_KINDS, which is
+    given 'args'. A passport is valid if every rule passes; a missing field
+    always fails. Rules are checked in order and checking stops at the first
+    failure.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._checks = tuple(
+            (key, FIELDS[key], RULE_KINDS[kind](*args))
+            for key, kind, *args in self.rules
+        )
+
+    def failures(self, passport):
+        """Yield the key of each rule that 'passport' fails, in order."""
+        for key, attribute, check in self._checks:
+            value = getattr(passport, attribute)
+            if value is None or not check(value):
+                yield key
+
+    def first_failure(self, passport):
+        """Return the key of the first rule 'passport' fails, or None."""
+        return next(self.failures(passport), None)
+
+    def __call__(self, passport):
+        """Return true if 'passport' passes every rule."""
+        return self.first_failure(passport) is None
+
+
+# Every field other than country_id (cid) must be set.
+RULES_V1 = [
+    ("byr", "present"),
+    ("iyr", "present"),
+    ("eyr", "present"),
+    ("hgt", "present"),
+    ("hcl", "present"),
+    ("ecl", "present"),
+    ("pid", "present"),
+]
+
+# As well as being set, every field other than country_id must be valid.
+RULES_V2 = [
+    ("byr", "range", 1920, 2002),
+    ("iyr", "range", 2010, 2020),
+    ("eyr", "range", 2020, 2030),
+    ("hgt", "units", {"cm": (150, 193), "in": (59, 76)}),
+    ("hcl", "pattern", r"#[0-9a-f]{6}"),
+    ("ecl", "one_of", "amb", "blu", "brn", "gry", "grn", "hzl", "oth"),
+    ("pid", "pattern", r"[0-9]{9}"),
+]
+
+RULE_SETS = {
+    "v1": RuleSet(RULES_V1),
+    "v2": RuleSet(RULES_V2),
+}
+
 
 ################################################################################
 
@@ -14,6 +173,8 @@ class passport:
     Unset fields are set to a value of None.
     """
 
+    __slots__ = tuple(FIELDS.values())
+
     def __init__(
         self,
         byr=None,
@@ -36,16 +197,7 @@ class passport:
 
     def is_valid(self):
         """Return false if any value other than country_id (cid) is None."""
-        return not None in {
-            self.birth_year,
-            self.issue_year,
-            self.expiration_year,
-            self.height,
-            self.hair_colour,
-            self.eye_colour,
-            self.passport_id,
-            # self.country_id,
-        }
+        return RULE_SETS["v1"](self)
 
     def is_valid_v2(self):
         """
@@ -61,60 +213,14 @@ class passport:
         eye_colour - One of 'amb', 'blu', 'brn', 'gry', 'grn', 'hzl', 'oth'.
         passport_id - A 9-digit number (leading zeros are counted)
         """
-
-        # Check for missing fields (other than country_id).
-        if not self.is_valid():
-            return False
-
-        # Height
-        if self.height.endswith("cm"):
-            height = (150 <= int(self.height[:-2]) <= 193)
-        elif self.height.endswith("in"):
-            height = (59 <= int(self.height[:-2]) <= 76)
-        else:
-            height = False
-        # DOB
-        birth = (1920 <= int(self.birth_year) <= 2002)
-        # issue year
-        issue = (2010 <= int(self.issue_year) <= 2020)
-        # expiration year
-        expire = (2020 <= int(self.expiration_year) <= 2030)
-        # Hair Color
-        allowed = set('0123456789abcdef')
-        hair = ((self.hair_colour[0] == '#') and
-                (set(self.hair_colour[1:]).issubset(allowed)))
-        # Eye Color
-        eye = (self.eye_colour in
-               ["amb", "blu", "brn", "gry", "grn", "hzl", "oth"]
-        )
-        # Passport ID
-        passport = (len(self.passport_id) == 9 and self.passport_id.isdigit())
-
-        #print(f"is_valid_v2(): height = {height}, birth = {birth}, "
-        #      + f"issue = {issue}, hair = {hair}, eye = {eye}, "
-        #      + f"passport = {passport}")
-
-        return not False in {birth, issue, expire, height, hair, eye, passport}
+        return RULE_SETS["v2"](self)
 
     def parse_pair(self, pair):
         """Read a key:value pair into the current state."""
-        split = pair.split(":")
-        if split[0].lower() == "byr":
-            self.birth_year = split[1]
-        elif split[0].lower() == "iyr":
-            self.issue_year = split[1]
-        elif split[0].lower() == "eyr":
-            self.expiration_year = split[1]
-        elif split[0].lower() == "hgt":
-            self.height = split[1]
-        elif split[0].lower() == "hcl":
-            self.hair_colour = split[1]
-        elif split[0].lower() == "ecl":
-            self.eye_colour = split[1]
-        elif split[0].lower() == "pid":
-            self.passport_id = split[1]
-        elif split[0].lower() == "cid":
-            self.country_id = split[1]
+        key, _, value = pair.partition(":")
+        attribute = FIELDS.get(key.lower())
+        if attribute is not None:
+            setattr(self, attribute, value)
 
     def __repr__(self):
         return (
@@ -136,37 +242,66 @@ class passport:
 ################################################################################
 
 
-def read_passports(filename):
+def read_passports(source):
     """
-    Read a file containing passport information into a list of passports.
+    Read passport information from 'source' (anything read_records accepts,
+    such as a filename or "-" for stdin), yielding each passport as soon as it
+    is complete.
 
     Each passport is defined by key:value pairs. Each pair is seperated by
     either a space or a newline.
 
     Each passport is separated by a blank line.
     """
-    ret = []
+    for fields in read_records(source):
+        current_passport = passport()
+        for pair in fields:
+            current_passport.parse_pair(pair)
+        yield current_passport
+
+
+################################################################################
 
-    with open(filename, "r") as passports_file:
-        current_passport = None
-        for line in passports_file:
-            if line in {"", "\n"}:
-                if current_passport is not None:
-                    ret.append(current_passport)
-                    current_passport = None
-                    continue
 
-            if current_passport is None:
-                current_passport = passport()
+class CountValid:
+    """Aggregator counting the passports that pass the RuleSet 'rules'."""
 
-            pairs = line.split()
-            for pair in pairs:
-                current_passport.parse_pair(pair)
+    def __init__(self, rules):
+        self.rules = rules
+        self.result = 0
 
-        if current_passport is not None:
-            ret.append(current_passport)
+    def add(self, passport):
+        if self.rules(passport):
+            self.result += 1
 
-    return ret
+
+class FailureHistogram:
+    """
+    Aggregator counting, for each key, the passports that fail the rules for
+    that key in the RuleSet 'rules'.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.result = collections.Counter()
+
+    def add(self, passport):
+        self.result.update(self.rules.failures(passport))
+
+
+def run_pipeline(passports, aggregators):
+    """
+    Feed every passport in the iterable 'passports' to each of 'aggregators'
+    in a single pass, and return the list of their results.
+
+    An aggregator is any object with an 'add(passport)' method and a 'result'
+    attribute.
+    """
+    for current in passports:
+        for aggregator in aggregators:
+            aggregator.add(current)
+
+    return [aggregator.result for aggregator in aggregators]
 
 
 ################################################################################
@@ -200,6 +335,232 @@ def count_valid_v2(passports):
     return count
 
 
+def _report_aggregators():
+    """
+    Return aggregators for the V1 valid count, the V2 valid count and the V2
+    failure histogram.
+    """
+    return [
+        CountValid(RULE_SETS["v1"]),
+        CountValid(RULE_SETS["v2"]),
+        FailureHistogram(RULE_SETS["v2"]),
+    ]
+
+
+def _validate_range(filename, start, end):
+    """
+    Return the V1 and V2 valid counts and the V2 failure histogram for the
+    passports in bytes [start, end) of 'filename'.
+    """
+    with open(filename, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            data = mm[start:end]
+
+    return run_pipeline(read_passports(data), _report_aggregators())
+
+
+def count_valid_parallel(filename, workers=None):
+    """
+    Validate the passports in 'filename' using a pool of 'workers' processes.
+
+    The file is memory mapped and split at blank lines so that no passport is
+    split between two workers. Returns the number of passports valid under the
+    V1 rules, the number valid under the V2 rules, and a Counter of how many
+    passports fail each V2 rule.
+    """
+    workers = workers or os.cpu_count() or 1
+
+    with open(filename, "rb") as f:
+        # mmap refuses to map an empty file.
+        if f.seek(0, 2) == 0:
+            return 0, 0, collections.Counter()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # A few ranges per worker keeps them all busy until the end.
+            ranges = block_ranges(mm, workers * 4)
+
+    valid = 0
+    valid_v2 = 0
+    failures = collections.Counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_validate_range, filename, start, end)
+            for start, end in ranges
+        ]
+        for future in futures:
+            range_valid, range_valid_v2, range_failures = future.result()
+            valid += range_valid
+            valid_v2 += range_valid_v2
+            failures.update(range_failures)
+
+    return valid, valid_v2, failures
+
+
+################################################################################
+
+
+# Splits a value into its leading digits and whatever follows them.
+NUMBER_RE = re.compile(r"([0-9]*)(.*)", re.DOTALL)
+
+# Numbers with more significant digits (leading zeros aside) than this are
+# stored as the largest int64.
+MAX_DIGITS = 18
+
+
+def _column_present(columns, key):
+    """The field must be set."""
+    return columns.present[key]
+
+
+def _column_range(columns, key, lower, upper):
+    """The field must be an integer between 'lower' and 'upper' (inclusive)."""
+    number = columns.numbers[key]
+    return (
+        columns.is_number[key]
+        & (columns.suffixes[key] == "")
+        & (lower <= number)
+        & (number <= upper)
+    )
+
+
+def _column_units(columns, key, units):
+    """
+    The field must be an integer followed by one of the units in 'units', a
+    dict of unit to an inclusive (lower, upper) range.
+    """
+    number = columns.numbers[key]
+    suffix = columns.suffixes[key]
+    ret = np.zeros(len(columns), dtype=bool)
+    for unit, (lower, upper) in units.items():
+        ret |= (suffix == unit) & (lower <= number) & (number <= upper)
+    return ret & columns.is_number[key]
+
+
+def _column_pattern(columns, key, pattern):
+    """The whole field must match the regular expression 'pattern'."""
+    fullmatch = re.compile(pattern).fullmatch
+    matches = np.frompyfunc(lambda value: fullmatch(value) is not None, 1, 1)
+    return columns.present[key] & matches(columns.text[key]).astype(bool)
+
+
+def _column_one_of(columns, key, *choices):
+    """The field must be one of 'choices'."""
+    return columns.present[key] & np.isin(columns.text[key], choices)
+
+
+# The whole-column version of each kind in RULE_KINDS.
+COLUMN_RULE_KINDS = {
+    "present": _column_present,
+    "range": _column_range,
+    "units": _column_units,
+    "pattern": _column_pattern,
+    "one_of": _column_one_of,
+}
+
+
+class PassportColumns:
+    """
+    Passports stored as columns rather than passport objects.
+
+    For each passport key (see FIELDS) there is:
+    present  - bool array, true where the field is set.
+    text     - str array of the raw value ('' where it is missing).
+    numbers  - int64 array of the value's leading digits (0 if none).
+    is_number - bool array, true where the value starts with a digit.
+    suffixes - str array of whatever follows the leading digits, so 'hgt' is
+               split into its number and unit.
+
+    Rule set declarations (such as RULES_V2) are evaluated as whole-column
+    boolean expressions, giving one result per passport.
+    """
+
+    def __init__(self, records=()):
+        """Build the columns from an iterable of field lists (read_records)."""
+        if np is None:
+            raise RuntimeError("PassportColumns requires numpy")
+
+        values = {key: [] for key in FIELDS}
+        for fields in records:
+            record = {}
+            for pair in fields:
+                key, _, value = pair.partition(":")
+                record[key.lower()] = value
+            for key, column in values.items():
+                column.append(record.get(key))
+
+        self._length = len(values["byr"])
+        self.present = {}
+        self.text = {}
+        self.numbers = {}
+        self.is_number = {}
+        self.suffixes = {}
+        for key, column in values.items():
+            self._add_column(key, column)
+
+    def _add_column(self, key, column):
+        """Parse the list of values (None where missing) for 'key'."""
+        numbers = []
+        is_number = []
+        suffixes = []
+        for value in column:
+            digits, suffix = NUMBER_RE.match(value or "").groups()
+            is_number.append(bool(digits))
+            if len(digits.lstrip("0")) > MAX_DIGITS:
+                numbers.append(np.iinfo(np.int64).max)
+            else:
+                numbers.append(int(digits or 0))
+            suffixes.append(suffix)
+
+        self.present[key] = np.array(
+            [value is not None for value in column], dtype=bool
+        )
+        self.text[key] = np.array(
+            [value or "" for value in column], dtype=str
+        )
+        self.numbers[key] = np.array(numbers, dtype=np.int64)
+        self.is_number[key] = np.array(is_number, dtype=bool)
+        self.suffixes[key] = np.array(suffixes, dtype=str)
+
+    @classmethod
+    def from_file(cls, source):
+        """Read the passports in 'source' (anything read_records accepts)."""
+        return cls(read_records(source))
+
+    def __len__(self):
+        return self._length
+
+    def evaluate(self, rules):
+        """
+        Return a bool array, true for each passport that passes every rule in
+        the declaration 'rules' (see RuleSet).
+        """
+        ret = np.ones(len(self), dtype=bool)
+        for key, kind, *args in rules:
+            ret &= COLUMN_RULE_KINDS[kind](self, key, *args)
+        return ret
+
+    def is_valid(self):
+        """Return a bool array of whether each passport is valid (V1)."""
+        return self.evaluate(RULES_V1)
+
+    def is_valid_v2(self):
+        """Return a bool array of whether each passport is valid (V2)."""
+        return self.evaluate(RULES_V2)
+
+    def select(self, mask):
+        """
+        Return a new PassportColumns holding just the passports chosen by
+        'mask' (a bool or index array).
+        """
+        ret = object.__new__(self.__class__)
+        ret.present = {key: col[mask] for key, col in self.present.items()}
+        ret.text = {key: col[mask] for key, col in self.text.items()}
+        ret.numbers = {key: col[mask] for key, col in self.numbers.items()}
+        ret.is_number = {key: col[mask] for key, col in self.is_number.items()}
+        ret.suffixes = {key: col[mask] for key, col in self.suffixes.items()}
+        ret._length = len(ret.present["byr"])
+        return ret
+
+
 ################################################################################
 
 if __name__ == "__main__":
@@ -207,12 +568,49 @@ if __name__ == "__main__":
         description="Find the number of trees that will be hit."
     )
 
-    parser.add_argument("filename")
+    parser.add_argument(
+        "filename", nargs="?", default="-",
+        help="Passport file to read (default: stdin)."
+    )
+    parser.add_argument(
+        "--failures", action="store_true",
+        help="Also report how many passports fail the V2 rules for each field."
+    )
+    parser.add_argument(
+        "--columnar", action="store_true",
+        help="Load the passports into numpy columns and validate those."
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="Number of processes to split the file between (0 for all CPUs)."
+    )
 
     opts = parser.parse_args()
 
-    passports = read_passports(opts.filename)
+    if opts.workers != 1 and opts.filename == "-":
+        # Workers each map their own byte range of the file.
+        parser.error("--workers needs a filename, not stdin")
+
+    if opts.columnar:
+        columns = PassportColumns.from_file(opts.filename)
+        valid = int(columns.is_valid().sum())
+        valid_v2 = int(columns.is_valid_v2().sum())
+        failures = collections.Counter({
+            rule[0]: int((~columns.evaluate([rule])).sum()) for rule in RULES_V2
+        })
+    elif opts.workers == 1:
+        valid, valid_v2, failures = run_pipeline(
+            read_passports(opts.filename), _report_aggregators()
+        )
+    else:
+        valid, valid_v2, failures = count_valid_parallel(
+            opts.filename, opts.workers
+        )
+
+    print("V1: There are {} valid passports.".format(valid))
 
-    print("V1: There are {} valid passports.".format(count_valid(passports)))
+    print("V2: There are {} valid passports.".format(valid_v2))
 
-    print("V2: There are {} valid passports.".format(count_valid_v2(passports)))
+    if opts.failures:
+        for key, *_ in RULES_V2:
+            print("V2: {} passports fail on '{}'.".format(failures[key], key))
@@ -2,55 +2,213 @@
 
 import argparse
 
+try:
+    import numpy as np
+except ImportError:
+    # numpy is only needed for read_seatids().
+    np = None
+
 ################################################################################
 
-# Copied from
-# https://stackoverflow.com/questions/5764782/iterate-through-pairs-of-items-in-a-python-list
-def pairs(seq):
-    i = iter(seq)
-    prev = next(i)
-    for item in i:
-        yield prev, item
-        prev = item
+# The back half of the rows and the right half of the columns are the 1 bits.
+SEAT_BITS = str.maketrans("FBLR", "0101")
 
 ################################################################################
 
-def bsearch(string, upper='B', lower='F', range_max=128):
-    """Return the result of a binary search on the input string."""
+def calculate_seatid(boarding, row_bits=7, column_bits=3):
+    """
+    Take an input boarding pass and output the unique seat ID.
 
-    c_range = list(range(0, range_max))
+    The boarding pass contains a string of 10 characters in the format
+    'XXXXXXXYYY', where each 'X' is either 'F' or 'B', and each 'Y' is either
+    'L' or 'R'. Other plane sizes can be given as the number of 'X' characters
+    ('row_bits') and 'Y' characters ('column_bits').
 
-    for char in string:
-        c_mid = int(len(c_range) / 2)
-        if char == upper:
-            c_range = c_range[c_mid:]
-        elif char == lower:
-            c_range = c_range[:c_mid]
-        #print(f"char = {char}, c_mid = {c_mid}, c_range = {c_range}")
+    The binary search down the rows and columns is the same as reading the
+    pass as a binary number (B and R being 1), and that number is exactly
+    (row * 2 ** column_bits) + column.
+    """
+    if len(boarding) != row_bits + column_bits:
+        raise ValueError(
+            f"Boarding pass {boarding!r} is not {row_bits + column_bits} long"
+        )
+    if boarding[:row_bits].strip("FB") or boarding[row_bits:].strip("LR"):
+        raise ValueError(
+            f"Boarding pass {boarding!r} must be F/B for the row then L/R for "
+            f"the column"
+        )
+
+    return int(boarding.translate(SEAT_BITS), 2)
+
+################################################################################
 
-    #print (f"end: {c_range}")
-    return c_range[0]
+def decode_seat(boarding, row_bits=7, column_bits=3):
+    """Return the (row, column) of an input boarding pass."""
+    seatid = calculate_seatid(boarding, row_bits, column_bits)
+    return seatid >> column_bits, seatid & ((1 << column_bits) - 1)
 
 ################################################################################
 
-def calculate_seatid(boarding):
+def read_seatids(filename, row_bits=7, column_bits=3):
     """
-    Take an input boarding pass and output the unique seat ID.
+    Return a numpy array of the seat ID of every boarding pass in 'filename'.
 
-    The boarding pass contains a string of 10 characters in the format
-    'XXXXXXXYYY', where each 'X' is either 'F' or 'B', and each 'Y' is either
-    'L' or 'R'.
+    The file is read as a single byte matrix, one pass per row, and the seat
+    IDs come from one product of the B/R bits with their binary weights.
     """
+    if np is None:
+        raise RuntimeError("read_seatids requires numpy")
+
+    width = row_bits + column_bits
+    with open(filename, 'rb') as f:
+        data = f.read()
+    if data and not data.endswith(b'\n'):
+        data += b'\n'
+
+    if len(data) % (width + 1):
+        raise ValueError(f"Every boarding pass must be {width} long")
+    matrix = np.frombuffer(data, dtype=np.uint8).reshape(-1, width + 1)
+    if (matrix[:, width] != ord('\n')).any():
+        raise ValueError(f"Every boarding pass must be {width} long")
+
+    rows = matrix[:, :row_bits]
+    columns = matrix[:, row_bits:width]
+    if not (
+        ((rows == ord('F')) | (rows == ord('B'))).all()
+        and ((columns == ord('L')) | (columns == ord('R'))).all()
+    ):
+        raise ValueError(
+            "Every boarding pass must be F/B for the row then L/R for the "
+            "column"
+        )
+
+    bits = (matrix[:, :width] == ord('B')) | (matrix[:, :width] == ord('R'))
+    weights = 1 << np.arange(width - 1, -1, -1, dtype=np.int64)
+    return bits.astype(np.int64) @ weights
 
-    #print (f"checking {boarding}")
-
-    # slice the string into the requisite parts.
-    row     = bsearch(boarding[:7])
-    column  = bsearch(boarding[7:], upper='R', lower='L', range_max=8)
+################################################################################
 
-    #print(f"row = {row}, column = {column}")
+class SeatMap:
+    """
+    An occupancy bitmap of a plane, with one byte per seat ID (1 if the seat is
+    taken), filled as boarding passes are added. Nothing needs sorting, so the
+    highest seat, the gaps and the free seats all come from linear scans.
+    """
 
-    return (row * 8) + column
+    def __init__(self, row_bits=7, column_bits=3):
+        self.row_bits = row_bits
+        self.column_bits = column_bits
+        self._seats = bytearray(1 << (row_bits + column_bits))
+        self.highest = None
+        self.lowest = None
+
+    @classmethod
+    def from_file(cls, filename, row_bits=7, column_bits=3):
+        """Stream the boarding passes in 'filename' into a new seat map."""
+        ret = cls(row_bits, column_bits)
+        with open(filename, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    ret.add_pass(line)
+        return ret
+
+    def __len__(self):
+        """Return the number of occupied seats."""
+        return self._seats.count(1)
+
+    def __contains__(self, seatid):
+        return 0 <= seatid < len(self._seats) and bool(self._seats[seatid])
+
+    def _check(self, seatid):
+        """Raise ValueError unless 'seatid' is a seat on this plane."""
+        if not 0 <= seatid < len(self._seats):
+            raise ValueError(f"Seat ID {seatid} is not on this plane")
+
+    def add(self, seatid):
+        """Mark 'seatid' as occupied."""
+        self._check(seatid)
+        self._seats[seatid] = 1
+        if self.highest is None or seatid > self.highest:
+            self.highest = seatid
+        if self.lowest is None or seatid < self.lowest:
+            self.lowest = seatid
+
+    def add_pass(self, boarding):
+        """Mark the seat on the boarding pass 'boarding' as occupied."""
+        self.add(calculate_seatid(boarding, self.row_bits, self.column_bits))
+
+    def gaps(self):
+        """
+        Return a list of (first, last) runs of free seats that have occupied
+        seats on both sides.
+        """
+        ret = []
+        if self.lowest is None:
+            return ret
+
+        # The highest seat is taken, so every run of free seats found below it
+        # must end at a taken seat.
+        start = self._seats.find(0, self.lowest, self.highest)
+        while start >= 0:
+            end = self._seats.find(1, start, self.highest + 1)
+            ret.append((start, end - 1))
+            start = self._seats.find(0, end, self.highest)
+
+        return ret
+
+    def missing(self):
+        """Return every free seat between the lowest and highest taken seats."""
+        return [
+            seat
+            for first, last in self.gaps()
+            for seat in range(first, last + 1)
+        ]
+
+    def rank(self, seatid):
+        """Return the number of occupied seats below 'seatid'."""
+        # One past the last seat counts every seat.
+        if not 0 <= seatid <= len(self._seats):
+            raise ValueError(f"Seat ID {seatid} is not on this plane")
+        return self._seats.count(1, 0, seatid)
+
+    def select(self, index):
+        """
+        Return the 'index'th (from 0) occupied seat, or None if there are not
+        that many.
+        """
+        if index < 0:
+            raise ValueError(f"Index {index} must not be negative")
+        seat = -1
+        for _ in range(index + 1):
+            seat = self._seats.find(1, seat + 1)
+            if seat < 0:
+                return None
+        return seat
+
+    def nearest_free(self, seatid):
+        """
+        Return the free seat closest to 'seatid' (the lower seat if two are
+        equally close), or None if the plane is full.
+        """
+        self._check(seatid)
+        above = self._seats.find(0, seatid)
+        below = self._seats.rfind(0, 0, seatid + 1)
+        if below < 0:
+            return None if above < 0 else above
+        if above < 0 or seatid - below <= above - seatid:
+            return below
+        return above
+
+    def free_in_row(self, row):
+        """Return the free seat IDs in 'row'."""
+        if not 0 <= row < 1 << self.row_bits:
+            raise ValueError(f"Row {row} is not on this plane")
+        first = row << self.column_bits
+        last = first + (1 << self.column_bits)
+        return [
+            seat for seat in range(first, last) if not self._seats[seat]
+        ]
 
 ################################################################################
 
@@ -63,25 +221,15 @@ if __name__ == "__main__":
 
     opts = parser.parse_args()
 
-    seats = []
-
-    with open(opts.filename, 'r') as f:
-        for line in f:
-            # strip the newline off the end of the line.
-            line = line.replace('\n', '')
-            seats.append(calculate_seatid(line))
-
-    # Sort the new list of seats.
-    seats.sort()
+    seats = SeatMap.from_file(opts.filename)
 
     # Get the highest value seat in the list.
-    print (f"The highest value seat is {seats[-1]}")
+    print (f"The highest value seat is {seats.highest}")
 
     ##### Part 2 #####
 
     # Find a seats that are missing from the list.
-    for p, n in pairs(seats):
-        #print (f"p = {p}, n = {n}")
-        if (n - p) != 1:
-            missing = p + 1
-            print(f"Looks like {missing} is missing (p = {p}, n = {n})")
+    for first, last in seats.gaps():
+        p = first - 1
+        n = last + 1
+        print(f"Looks like {first} is missing (p = {p}, n = {n})")
@@ -1,41 +1,68 @@
 #!/usr/bin/env python3
 
 import argparse
-from collections import OrderedDict
+import os
+import sys
+
+# The shared helpers live in the top level of the repo.
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+)
+
+from common import read_records
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy is only needed for read_groups_numpy().
+    np = None
 
 ################################################################################
 
-def group_total(group):
+# The bit for each question, 'a' being the lowest.
+QUESTION_BITS = {chr(ord('a') + i): 1 << i for i in range(26)}
+
+################################################################################
+
+def person_mask(answers):
     """
-    For an input 'group', return the number of questions they answered yes on.
+    Return a 26-bit int with a bit set for each question (a-z) in 'answers'.
+    Anything else, such as spaces, isn't a question and is ignored.
     """
+    mask = 0
+    for c in answers:
+        mask |= QUESTION_BITS.get(c, 0)
 
-    return len(OrderedDict.fromkeys(group))
+    return mask
 
 ################################################################################
 
-def group_total_v2(group):
+def group_total(group):
     """
     For an input 'group', return the number of questions they answered yes on.
-    """
 
-    ret = None
+    'group' is an iterable of each person's answers; since any string of
+    answers can count as a person, a single string of everyone's answers works
+    too.
+    """
+    anyone = 0
+    for person in group:
+        anyone |= person_mask(person)
 
-    #print (f"GROUP:\n{group}")
+    return anyone.bit_count()
 
-    for p in group:
-        person = list(p)
-        #person.sort()
-        #print (f"loop2 {len(person)} {person}")
+################################################################################
 
-        if ret == None:
-            ret = person
-        else:
-            ret = [c for c in person if c in ret]
-        #ret.sort()
-        #print (f"loop1 {len(ret)} {ret}")
+def group_total_v2(group):
+    """
+    For an input 'group', return the number of questions they answered yes on.
+    """
+    everyone = None
+    for person in group:
+        mask = person_mask(person)
+        everyone = mask if everyone is None else everyone & mask
 
-    return len(ret)
+    return 0 if everyone is None else everyone.bit_count()
 
 ################################################################################
 
@@ -52,29 +79,9 @@ def read_groups(filename):
 
     Each group is separated by a blank line.
     """
-    ret = []
-
-    with open(filename, "r") as group_file:
-        c_group = None
-        for line in group_file:
-            if line in {"", "\n"}:
-                if c_group is not None:
-                    ret.append(group_total(c_group))
-                    c_group = None
-                    continue
-
-            if c_group == None:
-                c_group = ""
-
-            # Strip newlines from the line
-            line = line.replace('\n', '')
-            c_group += line
-
-        if c_group is not None:
-            ret.append(group_total(c_group))
-            c_group = None
-
-        return ret
+    return [
+        group_total(group) for group in read_records(filename, by_line=True)
+    ]
 
 ################################################################################
 
@@ -91,29 +98,104 @@ def read_groups_v2(filename):
 
     Each group is separated by a blank line.
     """
-    ret = []
+    return [
+        group_total_v2(group) for group in read_records(filename, by_line=True)
+    ]
+
+################################################################################
+
+def read_survey(source):
+    """
+    Read group answer information from 'source' in a single pass and return
+    (number of groups, sum of the V1 totals, sum of the V2 totals).
+
+    'source' can be a filename, "-" for stdin, a binary file object or any
+    iterable of lines. Each person's answers are folded into their group's
+    "anyone" (V1) and "everyone" (V2) masks as they are read, so only the
+    current group is ever held.
+    """
+    groups = 0
+    anyone_total = 0
+    everyone_total = 0
+
+    for group in read_records(source, by_line=True):
+        anyone = 0
+        everyone = ~0
+        for person in group:
+            mask = person_mask(person)
+            anyone |= mask
+            everyone &= mask
+        groups += 1
+        anyone_total += anyone.bit_count()
+        everyone_total += everyone.bit_count()
+
+    return groups, anyone_total, everyone_total
+
+################################################################################
+
+def _popcount(masks):
+    """Return the number of bits set in each element of a uint32 array."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(masks).astype(np.int64)
+
+    masks = masks - ((masks >> 1) & 0x55555555)
+    masks = (masks & 0x33333333) + ((masks >> 2) & 0x33333333)
+    masks = (masks + (masks >> 4)) & 0x0F0F0F0F
+    return ((masks * 0x01010101) >> 24).astype(np.int64)
+
+################################################################################
+
+def read_groups_numpy(filename):
+    """
+    Return the per group totals of read_groups() and read_groups_v2(), as a
+    pair of numpy arrays, without any per line Python work. 'filename' can be
+    "-" for stdin.
+
+    Every byte of the file becomes its question bit, and each person's mask is
+    a bitwise_or.reduceat over their line. Blank lines mark where each group
+    starts, and the group masks are a bitwise_or.reduceat ("anyone") and a
+    bitwise_and.reduceat ("everyone") over the person masks.
+    """
+    if np is None:
+        raise RuntimeError("read_groups_numpy requires numpy")
+
+    if filename == "-":
+        raw = sys.stdin.buffer.read()
+    else:
+        with open(filename, "rb") as f:
+            raw = f.read()
+    data = np.frombuffer(raw + b"\n", dtype=np.uint8)
+
+    letter = (data >= ord("a")) & (data <= ord("z"))
+    shift = np.where(letter, data - ord("a"), 0).astype(np.uint32)
+    bits = np.where(letter, np.uint32(1) << shift, np.uint32(0))
+
+    # Every line, ending at (and not including) each newline.
+    ends = np.flatnonzero(data == ord("\n"))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    # A "\r\n" blank line holds just the "\r".
+    blank = (starts == ends) | (
+        (ends - starts == 1) & (data[starts] == ord("\r"))
+    )
 
-    with open(filename, "r") as group_file:
-        c_group = None
-        for line in group_file:
-            if line in {"", "\n"}:
-                if c_group is not None:
-                    ret.append(group_total_v2(c_group))
-                    c_group = None
-                    continue
+    people = np.flatnonzero(~blank)
+    if len(people) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
 
-            if c_group == None:
-                c_group = []
+    # Each person's segment runs on to the next person, which only adds the
+    # newlines and blank lines in between, and they have no bits set.
+    masks = np.bitwise_or.reduceat(bits, starts[people])
 
-            # Strip newlines from the line
-            line = line.replace('\n', '')
-            c_group.append(line)
+    # A person starts a new group if they are first or follow a blank line.
+    new_group = np.ones(len(people), dtype=bool)
+    new_group[1:] = blank[people[1:] - 1]
+    groups = np.flatnonzero(new_group)
 
-        if c_group is not None:
-            ret.append(group_total_v2(c_group))
-            c_group = None
+    anyone = np.bitwise_or.reduceat(masks, groups)
+    everyone = np.bitwise_and.reduceat(masks, groups)
 
-        return ret
+    return _popcount(anyone), _popcount(everyone)
 
 ################################################################################
 
@@ -122,19 +204,29 @@ if __name__ == "__main__":
         description="Find the number of trees that will be hit."
     )
 
-    parser.add_argument("filename")
+    parser.add_argument(
+        "filename", nargs="?", default="-",
+        help="Survey file to read (default: stdin)."
+    )
+    parser.add_argument(
+        "--backend", choices=["python", "numpy"], default="python",
+        help="Stream the survey in Python, or load it all into numpy."
+    )
 
     opts = parser.parse_args()
 
-    groups  = read_groups(opts.filename)
-
-    groups2 = read_groups_v2(opts.filename)
+    if opts.backend == "numpy":
+        totals, totals2 = read_groups_numpy(opts.filename)
+        groups = len(totals)
+        total = int(totals.sum())
+        total2 = int(totals2.sum())
+    else:
+        groups, total, total2 = read_survey(opts.filename)
 
-    #print (groups)
-    print (f"There are {len(groups)} groups (V1).")
+    print (f"There are {groups} groups (V1).")
 
-    print (f"The sum of all the group totals (V1) is {sum(groups)}")
+    print (f"The sum of all the group totals (V1) is {total}")
 
-    print (f"There are {len(groups2)} groups (V2).")
+    print (f"There are {groups} groups (V2).")
 
-    print (f"The sum of all the group totals (V2) is {sum(groups2)}")
+    print (f"The sum of all the group totals (V2) is {total2}")
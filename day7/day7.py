@@ -1,12 +1,13 @@
 #!/usr/bin/env python3
 
 import argparse
-from queue import Queue
-
-################################################################################
-
-def get_colour(bag):
-    return bag.replace(' bags', '').replace(' bag', '')
+import hashlib
+import os
+import struct
+import sys
+import time
+from array import array
+from collections import deque
 
 ################################################################################
 
@@ -32,109 +33,731 @@ class Bag:
 
 ################################################################################
 
+class BagGraph:
+    """
+    A compiled, read-only snapshot of a baglist's rules in CSR form, with bags
+    referred to by their interned id.
+
+    The bags that bag 'i' contains are targets[offsets[i]:offsets[i + 1]],
+    with the matching numbers in weights[offsets[i]:offsets[i + 1]]. The bags
+    that can directly contain bag 'i' are
+    rev_targets[rev_offsets[i]:rev_offsets[i + 1]].
+    """
+
+    def __init__(self, contents=()):
+        """Compile 'contents', a list of {bag id: number} dicts, one per id."""
+        offsets = array('L', [0])
+        targets = array('L')
+        weights = array('L')
+        for inner in contents:
+            targets.extend(inner.keys())
+            weights.extend(inner.values())
+            offsets.append(len(targets))
+
+        self._set_arrays(offsets, targets, weights)
+
+    @classmethod
+    def from_arrays(cls, offsets, targets, weights):
+        """Build a graph straight from its forward CSR arrays."""
+        ret = cls.__new__(cls)
+        ret._set_arrays(offsets, targets, weights)
+        return ret
+
+    def _set_arrays(self, offsets, targets, weights):
+        """Store the forward CSR arrays and work out the reverse ones."""
+        self.size = len(offsets) - 1
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+
+        # Counting sort of the edges by target to get the reverse adjacency.
+        counts = [0] * (self.size + 1)
+        for target in self.targets:
+            counts[target + 1] += 1
+        for i in range(self.size):
+            counts[i + 1] += counts[i]
+        self.rev_offsets = array('L', counts)
+        self.rev_targets = array('L', [0]) * len(self.targets)
+        position = counts[:-1]
+        for source in range(self.size):
+            for edge in range(self.offsets[source], self.offsets[source + 1]):
+                target = self.targets[edge]
+                self.rev_targets[position[target]] = source
+                position[target] += 1
+
+    def children(self, bag_id):
+        """Return the ids of the bags that 'bag_id' directly contains."""
+        return self.targets[self.offsets[bag_id]:self.offsets[bag_id + 1]]
+
+    def parents(self, bag_id):
+        """Return the ids of the bags that can directly contain 'bag_id'."""
+        return self.rev_targets[
+            self.rev_offsets[bag_id]:self.rev_offsets[bag_id + 1]
+        ]
+
+    def reachable(self, bag_id, reverse=False):
+        """
+        Return a bytearray marking every bag reachable from 'bag_id' by
+        following contents (or, if 'reverse', containers). 'bag_id' itself is
+        only marked if it can reach itself.
+        """
+        offsets = self.rev_offsets if reverse else self.offsets
+        targets = self.rev_targets if reverse else self.targets
+
+        visited = bytearray(self.size)
+        queue = deque([bag_id])
+        while queue:
+            current = queue.popleft()
+            for edge in range(offsets[current], offsets[current + 1]):
+                bag = targets[edge]
+                if not visited[bag]:
+                    visited[bag] = 1
+                    queue.append(bag)
+
+        return visited
+
+    def components(self):
+        """
+        Return the strongly connected components of the graph as lists of
+        ids, using an iterative Tarjan's algorithm.
+
+        A component is only listed after every component it can reach (the
+        components are in reverse topological order).
+        """
+        offsets = self.offsets
+        targets = self.targets
+        index = [-1] * self.size
+        low = [0] * self.size
+        on_stack = bytearray(self.size)
+        stack = []
+        counter = 0
+        ret = []
+
+        for root in range(self.size):
+            if index[root] != -1:
+                continue
+
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = 1
+            # Each entry is a bag and the next of its edges to follow.
+            work = [(root, offsets[root])]
+
+            while work:
+                current, edge = work[-1]
+                if edge < offsets[current + 1]:
+                    work[-1] = (current, edge + 1)
+                    bag = targets[edge]
+                    if index[bag] == -1:
+                        index[bag] = low[bag] = counter
+                        counter += 1
+                        stack.append(bag)
+                        on_stack[bag] = 1
+                        work.append((bag, offsets[bag]))
+                    elif on_stack[bag]:
+                        low[current] = min(low[current], index[bag])
+                    continue
+
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[current])
+
+                if low[current] == index[current]:
+                    component = []
+                    while True:
+                        bag = stack.pop()
+                        on_stack[bag] = 0
+                        component.append(bag)
+                        if bag == current:
+                            break
+                    ret.append(component)
+
+        return ret
+
+    def is_cyclic(self, component):
+        """Return true if the ids in 'component' (see components()) loop."""
+        return len(component) > 1 or component[0] in self.children(component[0])
+
+################################################################################
+
+class ReachabilityIndex:
+    """
+    A precomputed transitive closure of a BagGraph, answering "can bag X
+    eventually contain bag Y" in constant time.
+
+    Bags that contain each other (a strongly connected component) share one
+    row of a packed bit matrix: bit 'y' of a row is set if the component can
+    reach bag 'y'. Building it takes O(components * bags / 8) bytes.
+
+    build_seconds - how long the index took to build.
+    nbytes        - roughly how much memory the rows and lookup table take.
+    """
+
+    def __init__(self, graph):
+        start = time.perf_counter()
+
+        components = graph.components()
+        self.component = array('L', [0]) * graph.size
+        for number, members in enumerate(components):
+            for bag_id in members:
+                self.component[bag_id] = number
+
+        # Components come sinks first, so every component a component can
+        # reach already has its bits by the time it is visited.
+        reach = []
+        for number, members in enumerate(components):
+            bits = 0
+            for bag_id in members:
+                for bag in graph.children(bag_id):
+                    if self.component[bag] != number:
+                        bits |= reach[self.component[bag]] | (1 << bag)
+            if graph.is_cyclic(members):
+                for bag_id in members:
+                    bits |= 1 << bag_id
+            reach.append(bits)
+
+        row_bytes = (graph.size + 7) // 8
+        self.rows = [bits.to_bytes(row_bytes, 'little') for bits in reach]
+
+        self.build_seconds = time.perf_counter() - start
+        self.nbytes = (
+            row_bytes * len(self.rows)
+            + self.component.itemsize * len(self.component)
+        )
+
+    def reaches(self, outer, inner):
+        """Return true if bag id 'outer' can eventually hold bag id 'inner'."""
+        row = self.rows[self.component[outer]]
+        return (row[inner >> 3] >> (inner & 7)) & 1 == 1
+
+################################################################################
+
+# Identifies a baglist snapshot file, and its format version.
+SNAPSHOT_MAGIC = b"BAGSNAP\x01"
+
+# Item size of the arrays, source file size, source mtime (ns).
+SNAPSHOT_HEADER = struct.Struct("<BQq")
+
+# Used for each length prefix in a snapshot.
+SNAPSHOT_LENGTH = struct.Struct("<Q")
+
+################################################################################
+
+def snapshot_path(cache_dir, filename):
+    """Return where the snapshot of the rule file 'filename' is kept."""
+    name = hashlib.sha256(os.path.abspath(filename).encode()).hexdigest()
+    return os.path.join(cache_dir, f"{name}.bagsnap")
+
+################################################################################
+
+def _file_key(filename):
+    """
+    Return the snapshot key (size, mtime in ns, sha256 digest) of the current
+    contents of 'filename'. The file is stat'ed before it is hashed, so a
+    change part way through leaves a key that no longer matches.
+    """
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        stat = os.fstat(f.fileno())
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return stat.st_size, stat.st_mtime_ns, digest.digest()
+
+################################################################################
+
+def _read_snapshot(f, filename):
+    """
+    Read the open snapshot file 'f'. Returns None if it is not for the
+    current contents of 'filename' or doesn't hold a valid graph, or
+    (colours, offsets, targets, weights, key) where 'key' is the new
+    _file_key() of 'filename' if only its mtime changed, and None otherwise.
+    """
+    if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+        return None
+    itemsize, size, mtime_ns = SNAPSHOT_HEADER.unpack(
+        f.read(SNAPSHOT_HEADER.size)
+    )
+    digest = f.read(hashlib.sha256().digest_size)
+    source, colours = [
+        f.read(SNAPSHOT_LENGTH.unpack(f.read(SNAPSHOT_LENGTH.size))[0])
+        for _ in range(2)
+    ]
+
+    if itemsize != array('L').itemsize:
+        return None
+    if source != os.path.abspath(filename).encode():
+        return None
+    stat = os.stat(filename)
+    key = None
+    if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+        key = _file_key(filename)
+        if key[0] != size or key[2] != digest:
+            return None
+
+    colours = colours.decode().split("\n") if colours else []
+    edges = SNAPSHOT_LENGTH.unpack(f.read(SNAPSHOT_LENGTH.size))[0]
+    offsets = array('L')
+    offsets.fromfile(f, len(colours) + 1)
+    targets = array('L')
+    targets.fromfile(f, edges)
+    weights = array('L')
+    weights.fromfile(f, edges)
+
+    # Check the graph is well formed before anything is built from it.
+    if len(set(colours)) != len(colours):
+        return None
+    if offsets[0] != 0 or offsets[-1] != edges:
+        return None
+    if any(offsets[i] > offsets[i + 1] for i in range(len(colours))):
+        return None
+    if targets and max(targets) >= len(colours):
+        return None
+
+    return colours, offsets, targets, weights, key
+
+################################################################################
+
 class baglist:
     """
     This class contains a list of all bags, and methods for getting information
     about the bag list.
+
+    Colours are interned to integer ids as they are first seen. The rules are
+    stored per id and compiled into a BagGraph the first time a query needs
+    one after they change. Queries never modify the rules.
     """
 
     def __init__(self):
-        self._bags = {}
+        # Colour -> id, and id -> colour.
+        self._ids = {}
+        self._colours = []
+        # For each id, a dict of the id of each bag it contains -> number.
+        self._contents = []
+        # For each id, the set of ids of the bags that directly contain it.
+        self._parents = []
+        # Id -> total_contains() result. If a bag is in here then so is every
+        # bag it contains.
+        self._contains_memo = {}
+        # The compiled graph, or None if the rules have changed since.
+        self._graph = None
+        # The optional ReachabilityIndex, or None if it hasn't been built or
+        # the rules have changed since.
+        self._index = None
+
+    def _intern(self, colour):
+        """Return the id of 'colour', giving it a new one if needed."""
+        bag_id = self._ids.get(colour)
+        if bag_id is None:
+            bag_id = len(self._colours)
+            self._ids[colour] = bag_id
+            self._colours.append(colour)
+            self._contents.append({})
+            self._parents.append(set())
+            # A compiled graph or index doesn't know about the new id.
+            self._graph = None
+            self._index = None
+
+        return bag_id
+
+    @property
+    def graph(self):
+        """The compiled BagGraph of the current rules."""
+        if self._graph is None:
+            self._graph = BagGraph(self._contents)
+
+        return self._graph
 
     def add_bag(self, colour, contains=None):
         """
         Add a Bag 'colour' to the list of all bags.
 
         Note that if the bag already exists in the list of bags then the list of
-        bags it can contain will be updated in place instead.
+        bags it can contain will be replaced instead.
         """
+        self._set_contents(
+            self._intern(colour),
+            {self._intern(bag): num for bag, num in (contains or {}).items()},
+        )
 
-        newbag = self._bags.get(colour)
-        if newbag is None:
-            self._bags[colour] = Bag(colour, contains=contains)
-        else:
-            newbag.contains = contains
-
-        for b in contains:
-            somebag = self._bags.get(b)
-            if somebag is None:
-                #print (f"{colour}: adding {b}")
-                self._bags[b] = Bag(b, contained=[colour])
-            else:
-                #print (f"{colour}: {b}")
-                somebag.contained.append(colour)
+    def _set_contents(self, bag_id, new):
+        """Replace the contents of 'bag_id' with 'new', a {bag id: number}."""
+        old = self._contents[bag_id]
+        if new == old:
+            return
+
+        for bag in old:
+            self._parents[bag].discard(bag_id)
+        for bag in new:
+            self._parents[bag].add(bag_id)
+        self._contents[bag_id] = new
+        self._graph = None
+        self._index = None
+        if self._contains_memo:
+            self._invalidate(bag_id)
+
+    def _invalidate(self, bag_id):
+        """
+        Forget the memoised totals of 'bag_id' and every bag that can contain
+        it, as those are the only totals that depend on its contents.
+        """
+        stack = [bag_id]
+        while stack:
+            current = stack.pop()
+            # If a bag isn't memoised then neither is anything containing it.
+            if self._contains_memo.pop(current, None) is not None:
+                stack.extend(self._parents[current])
+
+    def get_bag(self, colour):
+        """Return a Bag describing 'colour', or None if it is unknown."""
+        bag_id = self._ids.get(colour)
+        if bag_id is None:
+            return None
+
+        return Bag(
+            colour,
+            contains={
+                self._colours[bag]: num
+                for bag, num in self._contents[bag_id].items()
+            },
+            contained=[
+                self._colours[bag] for bag in self.graph.parents(bag_id)
+            ],
+        )
 
     def parse_bag(self, baginfo):
-        """Return a bag object from a description of a bag 'baginfo'."""
+        """Add the bag described by the rule 'baginfo'."""
+        self.parse_rules(baginfo)
 
-        # strip the newline off the end of the line.
-        baginfo = baginfo.replace('\n', '')
-        baginfo = baginfo.replace('.', '')
+    def parse_rules(self, text):
+        """
+        Add every rule in 'text' (one per line) in a single pass, interning
+        each colour straight to its id.
 
-        main, inner = baginfo.split("contain", 1)
+        Each rule looks like:
+        <colour> bags contain <N> <colour> bag(s), <N> <colour> bag(s).
+        or
+        <colour> bags contain no other bags.
 
-        main = get_colour(main.strip())
+        Blank lines are skipped, and any other line that isn't a rule raises
+        ValueError. Rules before it have already been added.
 
-        contains = {}
+        A regex tokenizer measures about the same here once interning is
+        included, but would tie colours to a fixed number of words.
+        """
+        ids = self._ids
+        intern = self._intern
+        for number, line in enumerate(text.splitlines(), 1):
+            outer, found, inner = line.partition(" bags contain ")
+            if not found:
+                if not line.strip():
+                    continue
+                raise ValueError(f"Line {number} is not a bag rule: {line!r}")
+
+            current = ids.get(outer)
+            if current is None:
+                current = intern(outer)
+
+            contents = {}
+            if not inner.startswith("no other bags"):
+                for item in inner.split(", "):
+                    num, _, colour = item.partition(" ")
+                    # Drop the trailing " bag", " bags" or " bags.".
+                    end = colour.rfind(" bag")
+                    if end < 0 or not num.isdecimal():
+                        raise ValueError(
+                            f"Line {number} has a bad bag count: {item!r}"
+                        )
+                    colour = colour[:end]
+                    bag = ids.get(colour)
+                    if bag is None:
+                        bag = intern(colour)
+                    contents[bag] = int(num)
+
+            self._set_contents(current, contents)
+
+    def read_file(self, filename, index=False, cache_dir=None):
+        """
+        Read the rules in 'filename' ("-" for stdin) in one go. If 'index' is
+        set then also build a ReachabilityIndex for can_contain().
+
+        If 'cache_dir' is given (and this baglist is still empty) then a
+        compiled snapshot of the file is kept there. A fresh snapshot is loaded
+        instead of parsing the file; a stale one is rebuilt, keyed by the bytes
+        that were actually parsed. The snapshot is only a cache, so failing to
+        write it (a read-only or full 'cache_dir') isn't an error.
+        """
+        if filename == "-":
+            self.parse_rules(sys.stdin.read())
+        elif cache_dir is not None and not self._colours:
+            path = snapshot_path(cache_dir, filename)
+            if not self.load_snapshot(path, filename):
+                with open(filename, "rb") as f:
+                    # Stat first: if the file changes while it is read then
+                    # the saved mtime is already stale.
+                    stat = os.fstat(f.fileno())
+                    data = f.read()
+                self.parse_rules(data.decode())
+                key = (
+                    len(data), stat.st_mtime_ns, hashlib.sha256(data).digest()
+                )
+                try:
+                    os.makedirs(cache_dir, exist_ok=True)
+                    self.save_snapshot(path, filename, key)
+                except OSError:
+                    # Carry on with the rules that were just parsed.
+                    pass
+        else:
+            with open(filename, "r") as f:
+                self.parse_rules(f.read())
+
+        if index:
+            self.build_index()
 
-        if inner.strip() != "no other bags":
-            for c in inner.split(','):
-                pair = (get_colour(c.strip())).split(" ", 1)
-                contains[pair[1]] = int(pair[0])
+    def save_snapshot(self, path, filename, key=None):
+        """
+        Write the compiled rules to the snapshot file 'path', keyed by the
+        path of the rule file 'filename' that they were read from and 'key',
+        its (size, mtime in ns, sha256 digest). If 'key' isn't given then it
+        is taken from the file as it is now.
+
+        The snapshot holds the colour table followed by the CSR offsets,
+        targets and weights arrays. If writing it fails then no partial file
+        is left behind and the OSError is raised.
+        """
+        graph = self.graph
+        size, mtime_ns, digest = key or _file_key(filename)
+        source = os.path.abspath(filename).encode()
+        colours = "\n".join(self._colours).encode()
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(SNAPSHOT_MAGIC)
+                f.write(
+                    SNAPSHOT_HEADER.pack(graph.offsets.itemsize, size, mtime_ns)
+                )
+                f.write(digest)
+                for blob in (source, colours):
+                    f.write(SNAPSHOT_LENGTH.pack(len(blob)))
+                    f.write(blob)
+                f.write(SNAPSHOT_LENGTH.pack(len(graph.targets)))
+                graph.offsets.tofile(f)
+                graph.targets.tofile(f)
+                graph.weights.tofile(f)
+            # Readers only ever see a complete snapshot.
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def load_snapshot(self, path, filename):
+        """
+        Load the snapshot at 'path' into this (empty) baglist if it was made
+        from the current contents of 'filename'. Returns false, leaving the
+        baglist untouched, if there is no usable snapshot.
 
-        #print (f"main='{main}', inner='{inner}', contains='{contains}'")
+        The snapshot is fresh if the rule file's size and mtime are unchanged,
+        or failing that if its contents still hash the same.
+        """
+        try:
+            f = open(path, "rb")
+        except OSError:
+            # Missing, or a cache directory that can't be read.
+            return False
+
+        with f:
+            try:
+                snapshot = _read_snapshot(f, filename)
+            except (OSError, EOFError, ValueError, struct.error):
+                # An unreadable, truncated or corrupt snapshot is just rebuilt.
+                return False
+
+        if snapshot is None:
+            return False
+        colours, offsets, targets, weights, key = snapshot
+
+        for colour in colours:
+            self._intern(colour)
+        for bag_id in range(len(colours)):
+            edges = range(offsets[bag_id], offsets[bag_id + 1])
+            self._contents[bag_id] = {targets[e]: weights[e] for e in edges}
+            for edge in edges:
+                self._parents[targets[edge]].add(bag_id)
+        self._graph = BagGraph.from_arrays(offsets, targets, weights)
+
+        if key is not None:
+            # Same contents with a new mtime; save the new key so the file
+            # doesn't have to be hashed again next time.
+            try:
+                self.save_snapshot(path, filename, key)
+            except OSError:
+                pass
+
+        return True
+
+    def build_index(self):
+        """
+        Build (or rebuild) the ReachabilityIndex used by can_contain(), and
+        return it. It is dropped again if the rules change.
+        """
+        self._index = ReachabilityIndex(self.graph)
+        return self._index
+
+    def can_contain(self, outer, inner):
+        """
+        Return true if a bag of colour 'outer' can eventually contain a bag of
+        colour 'inner'. Uses the ReachabilityIndex if one has been built, or a
+        fresh traversal otherwise.
+        """
+        outer_id = self._ids.get(outer)
+        inner_id = self._ids.get(inner)
+        if outer_id is None or inner_id is None:
+            return False
 
-        self.add_bag(main, contains)
+        if self._index is not None:
+            return self._index.reaches(outer_id, inner_id)
 
-    def read_file(self, filename):
-        with open(filename, "r") as f:
-            for line in f:
-                self.parse_bag(line)
+        return self.graph.reachable(outer_id)[inner_id] == 1
 
     def total_contained(self, colour):
         """
         For a bag 'colour', return the total number of bags that can contain it.
         """
+        bag_id = self._ids.get(colour)
+        if bag_id is None:
+            return 0
+
+        return self.graph.reachable(bag_id, reverse=True).count(1)
 
-        target = self._bags.get(colour)
-        if target is None:
+    def total_contains(self, colour):
+        """Given a bag 'colour', return the number of bags it must contain."""
+        bag_id = self._ids.get(colour)
+        if bag_id is None:
             return 0
 
-        ret = target.contained
-        queue = Queue()
-        [queue.put(bag) for bag in ret]
+        return self._total_contains(bag_id)
 
-        while queue.empty() is not True:
-            # Getting an item removes it from the queue
-            current = self._bags.get(queue.get())
-            if current is None:
-                continue
-            for bag in current.contained:
-                if bag not in ret:
-                    ret.append(bag)
-                    queue.put(bag)
+    def _total_contains(self, bag_id):
+        """
+        Return the number of bags that 'bag_id' must contain, filling in the
+        memo for it and everything it contains.
 
-        #print (f"Containing: {ret}")
-        return len(ret)
+        The totals are computed with an explicit post-order walk rather than
+        recursion, so deep rule sets can't hit the recursion limit.
+        """
+        memo = self._contains_memo
+        if bag_id in memo:
+            return memo[bag_id]
+
+        in_progress = set()
+        stack = [bag_id]
+        while stack:
+            current = stack[-1]
+            if current in memo:
+                stack.pop()
+                continue
 
-    def total_contains(self, colour):
-        """Given a bag 'colour', return the number of bags it must contain."""
+            if current not in in_progress:
+                # First visit: total up the contents before this bag.
+                in_progress.add(current)
+                for bag in self._contents[current]:
+                    if bag in in_progress:
+                        raise ValueError(
+                            f"Bag {self._colours[bag]!r} contains itself"
+                        )
+                    if bag not in memo:
+                        stack.append(bag)
+                continue
 
-        target = self._bags.get(colour)
-        if target is None:
-            return 0
+            # Second visit: everything it contains has been totalled.
+            stack.pop()
+            in_progress.discard(current)
+            memo[current] = sum(
+                num + (num * memo[bag])
+                for bag, num in self._contents[current].items()
+            )
 
-        total = 0
-        for bag, num in target.contains.items():
-            total += num + (num * self.total_contains(bag))
+        return memo[bag_id]
 
-        return total
+    def analyse(self):
+        """
+        Work out total_contained() and total_contains() for every colour at
+        once, rather than one traversal per colour.
+
+        The rule graph is split into strongly connected components, which come
+        out in reverse topological order. Walking them in that order gives
+        every contents total from the totals of the bags inside. Walking them
+        the other way gives every bag's set of containers, as a Python int
+        bitset, from the sets of its direct containers.
+
+        Returns a pair of:
+        table  - dict of colour -> (total_contained, total_contains), where
+                 total_contains is None if the colour contains itself at some
+                 depth (and so would hold infinitely many bags).
+        cycles - list of the groups of colours that contain each other.
+        """
+        graph = self.graph
+        components = graph.components()
+
+        contains = [None] * graph.size
+        cycles = []
+        for component in components:
+            if graph.is_cyclic(component):
+                cycles.append(sorted(self._colours[bag] for bag in component))
+                continue
+            bag_id = component[0]
+            total = 0
+            for edge in range(graph.offsets[bag_id], graph.offsets[bag_id + 1]):
+                inner = contains[graph.targets[edge]]
+                if inner is None:
+                    total = None
+                    break
+                num = graph.weights[edge]
+                total += num + (num * inner)
+            contains[bag_id] = total
+
+        containers = [0] * graph.size
+        for component in reversed(components):
+            members = set(component)
+            bits = 0
+            for bag_id in component:
+                for parent in graph.parents(bag_id):
+                    if parent not in members:
+                        bits |= containers[parent] | (1 << parent)
+            if graph.is_cyclic(component):
+                # Every bag in a loop can contain every other, and itself.
+                for bag_id in component:
+                    bits |= 1 << bag_id
+            for bag_id in component:
+                containers[bag_id] = bits
+
+        # Keep the totals for total_contains(); a bag only has one if every
+        # bag inside it does too.
+        for bag_id, total in enumerate(contains):
+            if total is not None:
+                self._contains_memo[bag_id] = total
+
+        table = {
+            colour: (containers[bag_id].bit_count(), contains[bag_id])
+            for bag_id, colour in enumerate(self._colours)
+        }
+        return table, cycles
+
+    def _bags(self):
+        """Return a dict of every colour to a Bag describing it."""
+        return {colour: self.get_bag(colour) for colour in self._colours}
 
     def __repr__(self):
-        return (f"{self.__class__.__name__}{{_bags='{self._bags}'}}")
+        return (f"{self.__class__.__name__}{{_bags='{self._bags()}'}}")
 
     def __str__(self):
-        bagstring = "".join([f"\t{self._bags[bag]}\n" for bag in self._bags])
+        bags = self._bags()
+        bagstring = "".join([f"\t{bags[bag]}\n" for bag in bags])
         return (f"{self.__class__.__name__}\n{{\n{bagstring}}}")
 
 ################################################################################
@@ -145,11 +768,30 @@ if __name__ == "__main__":
     )
 
     parser.add_argument('filename')
+    parser.add_argument(
+        '--report', action='store_true',
+        help="Also print both totals for every colour, and any loops."
+    )
+    parser.add_argument(
+        '--index', action='store_true',
+        help="Build a reachability index and report what it costs."
+    )
+    parser.add_argument(
+        '--cache-dir',
+        help="Keep a compiled snapshot of the rule file in this directory."
+    )
 
     opts = parser.parse_args()
 
     main_baglist = baglist()
-    main_baglist.read_file(opts.filename)
+    main_baglist.read_file(opts.filename, cache_dir=opts.cache_dir)
+
+    if opts.index:
+        index = main_baglist.build_index()
+        print (
+            f"Built a reachability index in {index.build_seconds:.3f}s, "
+            f"using {index.nbytes} bytes."
+        )
 
     #print (main_baglist)
     target = "shiny gold"
@@ -162,3 +804,12 @@ if __name__ == "__main__":
     print (
         f"{target} bags are required to contain {total_part2} bags."
     )
+
+    if opts.report:
+        table, cycles = main_baglist.analyse()
+        print ()
+        for colour, (contained, contains) in sorted(table.items()):
+            contains = "infinite" if contains is None else contains
+            print (f"{colour}: contained by {contained}, contains {contains}")
+        for cycle in cycles:
+            print (f"Loop: {', '.join(cycle)}")